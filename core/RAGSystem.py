@@ -1,35 +1,97 @@
-import spacy
-import chromadb
+import os
+import re
+import json
 import uuid
 import time
-from typing import Dict, List
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import SpacyTextSplitter
+import threading
+import itertools
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 from core.logger import logger
-from core.utils import read_notes
-from otel_setup import tracer, agent_latency, rag_hits, agent_invocations
+from core.utils import iter_notes
+from core.cache import LRUCache
+from core.executor import get_executor
+from core.embedding_batcher import EmbeddingBatcher
+from core.lexical_index import BM25Index
+from core.vector_store import VectorStore, ChromaVectorStore, FaissVectorStore
+from core.ingestion import (
+    CHUNK_SIZE, CHUNK_OVERLAP, IngestionManifest, ParallelChunker,
+    batched, content_hash, chunk_id,
+)
+from otel_setup import (
+    tracer, agent_latency, rag_hits, agent_invocations,
+    ingest_documents, ingest_chunks, ingest_throughput,
+)
 
 
 class RAGSystem:
-    def __init__(self, memory_path: str = "./data/memory"):
+    def __init__(
+        self,
+        memory_path: str = "./data/memory",
+        write_batch_size: int = 256,
+        embed_batch_size: int = 32,
+        ingest_workers: int = 0,
+        query_cache_size: int = 1024,
+        result_cache_size: int = 512,
+        retrieval_mode: str = "dense",
+        vector_backend: str = "chroma",
+        faiss_options: Optional[Dict] = None,
+        embed_batch_window_ms: float = 2.0,
+        embed_max_batch: int = 64,
+    ):
         with tracer.start_as_current_span("rag.init"):
             start = time.time()
+            self.write_batch_size = write_batch_size
+            self.embed_batch_size = embed_batch_size
+            self.retrieval_mode = retrieval_mode
+
+            # --- Query caches ---
+            # Bumped on every knowledge_base write; part of the result cache key
+            self.knowledge_generation = 0
+            self.knowledge_listeners: List[Callable[[List[str]], None]] = []
+            self.query_embedding_cache = LRUCache("query_embedding", query_cache_size, sizeof=lambda e: e.nbytes)
+            self.retrieval_cache = LRUCache("retrieval_results", result_cache_size, sizeof=self._results_nbytes)
 
-            # --- Chroma client ---
-            self.client = chromadb.PersistentClient(path=memory_path)
+            # --- Vector store backend ---
+            self.memory_path = memory_path
+            self.vector_backend = vector_backend
+            self.faiss_options = faiss_options or {}
+            self.client = None
+            if vector_backend == "chroma":
+                import chromadb
+                self.client = chromadb.PersistentClient(path=memory_path)
+            self.manifest = IngestionManifest(os.path.join(memory_path, "ingest_manifest.json"))
 
             # --- Collections ---
             self.knowledge_collection = self._get_or_create_collection("knowledge_base")
             self.preference_collection = self._get_or_create_collection("user_preferences")
             self.conversation_collection = self._get_or_create_collection("conversation_memory")
 
-            # --- Models ---
-            self.nlp = self._load_spacy_model()
-            self.model = SentenceTransformer("all-MiniLM-L6-v2")
+            # --- Lexical index (kept in sync with knowledge_base) ---
+            self.lexical_index_path = os.path.join(memory_path, "bm25_index.npz")
+            self.lexical_index = self._load_lexical_index()
+
+            # --- Models (loaded on first use, see the properties below) ---
+            self._model = None
+            self._nlp = None
+            self._nlp_loaded = False
+            self._splitter = None
+            self._model_lock = threading.Lock()
+            # Query encodes from concurrent sessions share one forward pass (the whole micro-batch)
+            self.embedder = EmbeddingBatcher(
+                lambda texts: self.model.encode(texts, batch_size=max(len(texts), 1)),
+                window_ms=embed_batch_window_ms,
+                max_batch=embed_max_batch,
+            )
 
             # --- Seed knowledge ---
-            self._ingest_seed_notes()
+            if ingest_workers > 0:
+                self.bulk_ingest(split_workers=ingest_workers, embed_workers=ingest_workers)
+            else:
+                self._ingest_seed_notes()
 
             duration = (time.time() - start) * 1000
             agent_latency.record(duration, {"component": "rag", "stage": "init"})
@@ -39,48 +101,217 @@ class RAGSystem:
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
-    def _get_or_create_collection(self, name: str):
+    def _get_or_create_collection(self, name: str) -> VectorStore:
+        if self.vector_backend == "faiss":
+            return FaissVectorStore(os.path.join(self.memory_path, "faiss"), name, **self.faiss_options)
+        if self.vector_backend != "chroma":
+            raise ValueError(f"Unknown vector backend: {self.vector_backend}")
+
         try:
-            return self.client.create_collection(name=name, metadata={"hnsw:space": "cosine"})
+            return ChromaVectorStore(self.client.create_collection(name=name, metadata={"hnsw:space": "cosine"}))
         except Exception:
             logger.info(f"Using existing collection: {name}")
-            return self.client.get_collection(name)
+            return ChromaVectorStore(self.client.get_collection(name))
 
-    def _load_spacy_model(self):
-        try:
-            return spacy.load("en_core_web_sm")
-        except OSError:
-            logger.warning("spaCy model not found, sentence splitting disabled")
-            return None
+    def _load_lexical_index(self) -> BM25Index:
+        if os.path.exists(self.lexical_index_path):
+            try:
+                index = BM25Index.load(self.lexical_index_path)
+                if len(index) == self.knowledge_collection.count():
+                    return index
+            except Exception:
+                logger.exception("BM25 index unreadable")
+
+        logger.info("Rebuilding BM25 index from knowledge_base")
+        index = BM25Index()
+        total = self.knowledge_collection.count()
+        for offset in range(0, total, self.write_batch_size):
+            page = self.knowledge_collection.get(include=["documents"], limit=self.write_batch_size, offset=offset)
+            index.add(page["ids"], page["documents"])
+        if total:
+            index.save(self.lexical_index_path)
+        return index
+
+    def _upsert_knowledge(self, ids: List[str], documents: List[str], embeddings: List, metadatas: List[Dict]):
+        self.knowledge_collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        self.lexical_index.add(ids, documents)
+        self._bump_knowledge_generation(ids)
+
+    def _delete_knowledge(self, where: Dict):
+        ids = self.knowledge_collection.get(where=where, include=[])["ids"]
+        if not ids:
+            return
+        self.knowledge_collection.delete(ids=ids)
+        self.lexical_index.delete(ids)
+        self._bump_knowledge_generation(ids)
+
+    def _bump_knowledge_generation(self, ids: List[str]):
+        """Invalidate cached retrieval results after any knowledge_base write, and tell listeners which chunks changed."""
+        self.knowledge_generation += 1
+        self.retrieval_cache.clear()
+        for listener in self.knowledge_listeners:
+            listener(ids)
+
+    def add_knowledge_listener(self, listener: Callable[[List[str]], None]):
+        """Register a callback for knowledge_base writes (called with the written or deleted chunk IDs)."""
+        self.knowledge_listeners.append(listener)
+
+    def existing_knowledge_ids(self, ids: List[str]) -> set:
+        return set(self.knowledge_collection.get(ids=list(ids), include=[])["ids"]) if ids else set()
+
+    @property
+    def model(self):
+        """SentenceTransformer, loaded on first use so an up-to-date boot never pays for it."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer("all-MiniLM-L6-v2")
+        return self._model
+
+    @property
+    def nlp(self):
+        """Chunking view of the shared spaCy pipeline, or None when the model isn't installed."""
+        if not self._nlp_loaded:
+            with self._model_lock:
+                if not self._nlp_loaded:
+                    from core.nlp import get_nlp_registry
+                    self._nlp = get_nlp_registry().view("chunking")
+                    self._nlp_loaded = True
+        return self._nlp
+
+    @property
+    def splitter(self):
+        """Sentence-aware chunker over the shared pipeline (built once, not per call)."""
+        if self._splitter is None and self.nlp:
+            from core.nlp import SentenceTextSplitter
+            self._splitter = SentenceTextSplitter(self.nlp, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        return self._splitter
 
     # ------------------------------------------------------------------
     # Seed knowledge ingestion
     # ------------------------------------------------------------------
-    def _ingest_seed_notes(self):
-        if self.knowledge_collection.count() > 0:
-            logger.info(f"Knowledge base already populated ({self.knowledge_collection.count()} chunks)")
+    def bulk_ingest(self, split_workers: int = 0, embed_workers: int = 0, docs_per_task: int = 64):
+        """
+        Seed ingestion for large first builds: spaCy splitting runs in a pool of
+        `split_workers` processes (nlp.pipe batches of `docs_per_task` documents)
+        and embedding in a sentence-transformers multi-process pool of
+        `embed_workers` CPU workers. A size of 0 uses one worker per CPU core.
+
+        The pools (and the model) are only started once a changed note turns up,
+        so an unchanged restart costs a hash pass, not N model loads.
+        """
+        seen: set[str] = set()
+        changed = self._iter_changed_notes(seen)
+        first = next(changed, None)
+        if first is None:
+            self._ingest_seed_notes(changed=iter(()), seen=seen)
             return
+        changed = itertools.chain([first], changed)
 
-        docs, paths = read_notes()
-        if not docs:
+        split_workers = split_workers or os.cpu_count()
+        embed_workers = embed_workers or os.cpu_count()
+
+        chunker = ParallelChunker(split_workers, docs_per_task=docs_per_task) if self.nlp else None
+        pool = self.model.start_multi_process_pool(target_devices=["cpu"] * embed_workers)
+        try:
+            self._ingest_seed_notes(chunker=chunker, embed_pool=pool, changed=changed, seen=seen)
+        finally:
+            self.model.stop_multi_process_pool(pool)
+            if chunker:
+                chunker.close()
+
+    def _ingest_seed_notes(self, chunker: Optional[ParallelChunker] = None, embed_pool: Optional[Dict] = None,
+                           changed: Optional[Iterator] = None, seen: Optional[set] = None):
+        """
+        Incrementally sync notes/ into the knowledge base. Only files whose content
+        hash differs from the manifest are re-chunked and re-embedded; chunks of
+        removed files are deleted.
+
+        Runs as a streaming pipeline (read -> split -> embed -> write) so peak memory
+        is bounded by the write batch size rather than by the size of the notes tree.
+        """
+        start = time.time()
+        seen = set() if seen is None else seen
+        stats = {"docs": 0, "chunks": 0}
+
+        if changed is None:
+            changed = self._iter_changed_notes(seen)
+        split = chunker.split(changed) if chunker else self._iter_split_notes(changed)
+        records = self._iter_chunk_records(split, stats)
+
+        for batch in batched(records, self.write_batch_size):
+            self._write_chunk_batch(batch, embed_pool)
+
+        removed = [path for path in self.manifest.paths() if path not in seen]
+        for path in removed:
+            self._delete_knowledge(where={"path": path})
+            self.manifest.remove(path)
+            logger.info(f"🗑️ Removed chunks for deleted note {path}")
+
+        if not seen and not removed:
             logger.warning("No seed documents found")
             return
 
-        splitter = SpacyTextSplitter(chunk_size=400, chunk_overlap=50) if self.nlp else None
+        if not stats["docs"] and not removed:
+            logger.info(f"Knowledge base up to date ({self.knowledge_collection.count()} chunks)")
+            return
+
+        self.knowledge_collection.persist()
+        self.manifest.save()
+        self.lexical_index.save(self.lexical_index_path)
+
+        elapsed = max(time.time() - start, 1e-6)
+        ingest_throughput.record(stats["docs"] / elapsed, {"unit": "docs/s"})
+        logger.info(
+            f"✅ Synced {stats['docs']} changed and {len(removed)} removed notes "
+            f"({stats['chunks']} chunks, {stats['docs'] / elapsed:.1f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s)"
+        )
 
-        all_chunks, all_metadata = [], []
-        for doc, path in zip(docs, paths):
-            chunks = splitter.split_text(doc) if splitter else [doc]
+    def _iter_changed_notes(self, seen: set):
+        """Stage 1: stream notes from disk, yielding only new or edited files."""
+        for doc, path in iter_notes():
+            path = os.path.normpath(path)
+            seen.add(path)
+            doc_hash = content_hash(doc)
+            if self.manifest.hash_for(path) != doc_hash:
+                yield path, doc, doc_hash
+
+    def _iter_split_notes(self, notes):
+        """Stage 2a (serial): split each changed note in-process."""
+        for path, doc, doc_hash in notes:
+            splitter = self.splitter
+            yield path, doc_hash, splitter.split_text(doc) if splitter else [doc]
+
+    def _iter_chunk_records(self, split_notes, stats: Dict):
+        """Stage 2b: turn split notes into (id, chunk, metadata) records."""
+        for path, doc_hash, chunks in split_notes:
             domain = self._infer_domain(path)
-            all_chunks.extend(chunks)
-            all_metadata.extend([{"source": "seed", "domain": domain, "path": path} for _ in chunks])
+            ids = [chunk_id(path, doc_hash, i) for i in range(len(chunks))]
+
+            # Drop the previous version's chunks (including pre-manifest random IDs)
+            self._delete_knowledge(where={"path": path})
+            self.manifest.record(path, doc_hash, ids)
+
+            stats["docs"] += 1
+            stats["chunks"] += len(chunks)
+            ingest_documents.add(1)
             logger.info(f"{len(chunks)} chunks created from {path}")
 
-        embeddings = self.model.encode(all_chunks).tolist()
-        ids = [str(uuid.uuid4()) for _ in all_chunks]
+            for cid, chunk in zip(ids, chunks):
+                yield cid, chunk, {"source": "seed", "domain": domain, "path": path}
 
-        self.knowledge_collection.add(ids=ids, documents=all_chunks, embeddings=embeddings, metadatas=all_metadata)
-        logger.info(f"✅ Stored {len(all_chunks)} knowledge chunks")
+    def _write_chunk_batch(self, batch: List, embed_pool: Optional[Dict] = None):
+        """Stage 3: embed one fixed-size batch and upsert it."""
+        start = time.time()
+        ids, chunks, metadatas = (list(column) for column in zip(*batch))
+
+        embeddings = self.model.encode(chunks, batch_size=self.embed_batch_size, pool=embed_pool).tolist()
+        self._upsert_knowledge(ids=ids, documents=chunks, embeddings=embeddings, metadatas=metadatas)
+
+        ingest_chunks.add(len(chunks))
+        ingest_throughput.record(len(chunks) / max(time.time() - start, 1e-6), {"unit": "chunks/s"})
+        logger.debug(f"Wrote batch of {len(chunks)} chunks")
 
     def _infer_domain(self, path: str) -> str:
         p = path.lower()
@@ -92,18 +323,225 @@ class RAGSystem:
     # ------------------------------------------------------------------
     # Knowledge retrieval
     # ------------------------------------------------------------------
-    def retrieve_knowledge(self, query: str, top_k: int = 5) -> List[Dict]:
-        with tracer.start_as_current_span("rag.search"):
-            embedding = self.model.encode([query])[0].tolist()
-            results = self.knowledge_collection.query(query_embeddings=[embedding], n_results=top_k)
+    def retrieve_knowledge(self, query: str, top_k: int = 5, where: Optional[Dict] = None, mode: Optional[str] = None) -> List[Dict]:
+        return self.retrieve_knowledge_batch([query], top_k=top_k, where=where, mode=mode)[0]
+
+    async def aretrieve_knowledge(self, query: str, top_k: int = 5, where: Optional[Dict] = None,
+                                  mode: Optional[str] = None) -> List[Dict]:
+        """retrieve_knowledge on the "rag" executor, so encoding and the vector query don't block the loop."""
+        return (await self.aretrieve_knowledge_batch([query], top_k=top_k, where=where, mode=mode))[0]
+
+    async def aretrieve_knowledge_batch(self, queries: List[str], top_k: int = 5, where: Optional[Dict] = None,
+                                        mode: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Embedding-cache misses are encoded first, awaited on the loop through the
+        EmbeddingBatcher, so concurrent sessions share a batch instead of each
+        holding a "rag" thread; only the vector query then runs on the executor.
+        """
+        mode = mode or self.retrieval_mode
+        embeddings = await self._aembed_queries(self._uncached_dense_queries(queries, top_k, where, mode))
+        return await get_executor("rag").run(
+            self.retrieve_knowledge_batch, queries, top_k=top_k, where=where, mode=mode, embeddings=embeddings,
+        )
+
+    def _uncached_dense_queries(self, queries: List[str], top_k: int, where: Optional[Dict], mode: str) -> Dict[str, str]:
+        """{normalized: raw} for the queries a retrieval will have to embed."""
+        filters = json.dumps(where, sort_keys=True)
+        dense = {}
+        for query in queries:
+            norm = self._normalize_query(query)
+            if (norm, top_k, filters, mode, self.knowledge_generation) in self.retrieval_cache:
+                continue
+            if self._resolve_mode(norm, mode) != "lexical":
+                dense[norm] = query
+        return dense
+
+    def retrieve_knowledge_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        where: Optional[Dict] = None,
+        mode: Optional[str] = None,
+        embeddings: Optional[Dict[str, np.ndarray]] = None,
+    ) -> List[List[Dict]]:
+        """
+        Retrieve top-k knowledge chunks for several queries at once. Cache misses are
+        encoded in a single forward pass and sent as one multi-embedding Chroma query.
+
+        `mode` (default: self.retrieval_mode) is one of:
+        - "dense":   cosine similarity only
+        - "lexical": BM25 only, no embedding needed
+        - "hybrid":  BM25 and dense rankings fused with reciprocal-rank fusion
+        - "auto":    lexical for short keyword queries, hybrid otherwise
+
+        `embeddings` holds query embeddings already computed, by normalized query.
+        """
+        mode = mode or self.retrieval_mode
+        with tracer.start_as_current_span("rag.search") as span:
+            span.set_attribute("batch.size", len(queries))
+            span.set_attribute("retrieval.mode", mode)
+            generation = self.knowledge_generation
+            filters = json.dumps(where, sort_keys=True)
+
+            normalized = [self._normalize_query(q) for q in queries]
+            found: Dict[str, List[Dict]] = {}
+            pending: Dict[str, str] = {}  # normalized -> raw query, deduplicated
+            for norm, query in zip(normalized, queries):
+                if norm in found or norm in pending:
+                    continue
+                cached = self.retrieval_cache.get((norm, top_k, filters, mode, generation))
+                if cached is not None:
+                    found[norm] = cached
+                else:
+                    pending[norm] = query
+
+            span.set_attribute("cache.hits", len(found))
+            if pending:
+                for norm, docs in self._search(pending, top_k, where, mode, embeddings).items():
+                    # A write during the query bumps the generation, so this entry can never be served stale
+                    self.retrieval_cache.put((norm, top_k, filters, mode, generation), docs)
+                    found[norm] = docs
+
+            batch = [[dict(doc) for doc in found[norm]] for norm in normalized]
+            rag_hits.add(sum(len(docs) for docs in batch))
+            return batch
+
+    def _search(self, queries: Dict[str, str], top_k: int, where: Optional[Dict], mode: str,
+                known: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, List[Dict]]:
+        query_modes = {norm: self._resolve_mode(norm, mode) for norm in queries}
+        dense = [norm for norm, m in query_modes.items() if m != "lexical"]
+        lexical = [norm for norm, m in query_modes.items() if m != "dense"]
+        candidate_k = top_k * 2 if "hybrid" in query_modes.values() else top_k
+
+        # Dense candidates: one forward pass, one multi-embedding query
+        dense_hits: Dict[str, List[Dict]] = {}
+        query_embeddings: Dict[str, List[float]] = {}
+        if dense:
+            embeddings = self._embed_queries({norm: queries[norm] for norm in dense}, known)
+            results = self.knowledge_collection.query(query_embeddings=embeddings, n_results=candidate_k, where=where)
+            for i, norm in enumerate(dense):
+                query_embeddings[norm] = embeddings[i]
+                dense_hits[norm] = [
+                    {"id": cid, "content": doc, "metadata": meta, "similarity": 1 - dist}
+                    for cid, doc, meta, dist in zip(
+                        results["ids"][i], results["documents"][i], results["metadatas"][i], results["distances"][i]
+                    )
+                ]
+
+        # Lexical candidates: over-fetch when filtering, metadata is only known after the lookup
+        lexical_k = candidate_k * 4 if where else candidate_k
+        lexical_hits = {norm: self.lexical_index.search(norm, lexical_k) for norm in lexical}
+        chunks = self._get_chunks({
+            cid for norm, hits in lexical_hits.items() for cid, _ in hits
+            if all(cid != d["id"] for d in dense_hits.get(norm, []))
+        })
+        for norm, hits in lexical_hits.items():
+            texts = {d["id"]: (d["content"], d["metadata"]) for d in dense_hits.get(norm, [])}
+            texts.update({cid: (doc, meta) for cid, (doc, meta, _) in chunks.items()})
+            lexical_hits[norm] = [
+                (cid, score) for cid, score in hits
+                if cid in texts and self._matches_where(texts[cid][1], where)
+            ][:candidate_k]
+
+        out = {}
+        for norm, m in query_modes.items():
+            if m == "dense":
+                out[norm] = dense_hits[norm][:top_k]
+            elif m == "lexical":
+                hits = lexical_hits[norm][:top_k]
+                best = hits[0][1] if hits else 1.0
+                out[norm] = [
+                    {"id": cid, "content": chunks[cid][0], "metadata": chunks[cid][1], "similarity": score / best}
+                    for cid, score in hits
+                ]
+            else:
+                out[norm] = self._fuse(dense_hits[norm], lexical_hits[norm], chunks, query_embeddings[norm], top_k)
+        return out
 
-            hits = len(results["documents"][0])
-            rag_hits.add(hits)
+    def _resolve_mode(self, normalized: str, mode: str) -> str:
+        if mode == "auto":
+            return "lexical" if self.lexical_index.is_keyword_query(normalized) else "hybrid"
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        return mode
 
-            docs = []
-            for doc, meta, dist in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
-                docs.append({"content": doc, "metadata": meta, "similarity": 1 - dist})
-            return docs
+    def _get_chunks(self, ids) -> Dict[str, Tuple[str, Dict, np.ndarray]]:
+        if not ids:
+            return {}
+        page = self.knowledge_collection.get(ids=list(ids), include=["documents", "metadatas", "embeddings"])
+        return {
+            cid: (doc, meta, np.asarray(emb, dtype=np.float32))
+            for cid, doc, meta, emb in zip(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+        }
+
+    @staticmethod
+    def _fuse(dense: List[Dict], lexical: List[Tuple[str, float]], chunks: Dict, query_embedding: List[float], top_k: int, k: int = 60) -> List[Dict]:
+        """Reciprocal-rank fusion of the dense and BM25 rankings."""
+        scores: Dict[str, float] = defaultdict(float)
+        docs = {d["id"]: d for d in dense}
+        for rank, d in enumerate(dense):
+            scores[d["id"]] += 1 / (k + rank + 1)
+
+        q = np.asarray(query_embedding, dtype=np.float32)
+        for rank, (cid, _) in enumerate(lexical):
+            scores[cid] += 1 / (k + rank + 1)
+            if cid not in docs:
+                doc, meta, emb = chunks[cid]
+                cosine = float(np.dot(q, emb) / (np.linalg.norm(q) * np.linalg.norm(emb) + 1e-12))
+                docs[cid] = {"id": cid, "content": doc, "metadata": meta, "similarity": cosine}
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [{**docs[cid], "score": scores[cid]} for cid in ranked]
+
+    @staticmethod
+    def _matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+        """Flat equality filters only, which is all the knowledge base callers use."""
+        return not where or all(metadata.get(key) == value for key, value in where.items())
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embeddings for raw queries, shared with retrieval through the query-embedding cache."""
+        normalized = {self._normalize_query(q): q for q in queries}
+        embeddings = dict(zip(normalized, self._embed_queries(normalized)))
+        return np.asarray([embeddings[self._normalize_query(q)] for q in queries], dtype=np.float32)
+
+    async def aembed_queries(self, queries: List[str]) -> np.ndarray:
+        normalized = {self._normalize_query(q): q for q in queries}
+        embeddings = await self._aembed_queries(normalized)
+        return np.asarray([embeddings[self._normalize_query(q)] for q in queries], dtype=np.float32)
+
+    def _embed_queries(self, queries: Dict[str, str], known: Optional[Dict[str, np.ndarray]] = None) -> List[List[float]]:
+        """Embed {normalized: raw} queries, encoding all embedding-cache misses in one pass."""
+        known = known or {}
+        embeddings = {norm: known[norm] if norm in known else self.query_embedding_cache.get(norm) for norm in queries}
+        missing = [norm for norm, emb in embeddings.items() if emb is None]
+        if missing:
+            embeddings.update(self._cache_embeddings(missing, self.embedder.encode([queries[norm] for norm in missing])))
+        return [embeddings[norm].tolist() for norm in queries]
+
+    async def _aembed_queries(self, queries: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """_embed_queries for the event loop: misses join the batcher's window without blocking it."""
+        embeddings = {norm: self.query_embedding_cache.get(norm) for norm in queries}
+        missing = [norm for norm, emb in embeddings.items() if emb is None]
+        if missing:
+            encoded = await self.embedder.aencode([queries[norm] for norm in missing])
+            embeddings.update(self._cache_embeddings(missing, encoded))
+        return embeddings
+
+    def _cache_embeddings(self, norms: List[str], encoded: np.ndarray) -> Dict[str, np.ndarray]:
+        # Rows are views into the whole batch; copies keep a cached entry from pinning it
+        rows = {norm: np.array(emb, copy=True) for norm, emb in zip(norms, encoded)}
+        for norm, emb in rows.items():
+            self.query_embedding_cache.put(norm, emb)
+        return rows
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Case, whitespace and trailing punctuation don't change what is being asked."""
+        return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+    @staticmethod
+    def _results_nbytes(docs: List[Dict]) -> int:
+        return sum(len(d["content"]) + len(str(d["metadata"])) + 64 for d in docs)
 
     # ------------------------------------------------------------------
     # Preferences
@@ -116,36 +554,51 @@ class RAGSystem:
             embeddings=[embedding],
             metadatas=[{"type": "preference", "source": "user"}],
         )
+        self.preference_collection.persist()
 
     # ------------------------------------------------------------------
     # Conversation memory
     # ------------------------------------------------------------------
     def add_to_vector_db(self, context: Dict):
         """Add conversation context to conversation_collection safely."""
-        text = context.get("content") or ""
-        if not text.strip():
+        self.add_many_to_vector_db([context])
+
+    def add_many_to_vector_db(self, contexts: List[Dict]) -> int:
+        """
+        Batched add_to_vector_db: all texts are split in one spaCy pass, every chunk
+        is embedded in one encode call and written with a single collection add.
+        Returns the number of chunks written.
+        """
+        texts = [(c.get("content") or "") for c in contexts]
+        texts = [t for t in texts if t.strip()]
+        if not texts:
             logger.warning("⚠️ No valid context text found, skipping addition.")
-            return
+            return 0
 
-        logger.info(f"Adding conversation context: {text[:100]}...")
+        logger.info(f"Adding {len(texts)} conversation contexts: {texts[0][:100]}...")
 
         # Chunk text
-        chunks = [text]
-        if self.nlp:
-            splitter = SpacyTextSplitter(chunk_size=400, chunk_overlap=50)
-            chunks = splitter.split_text(text)
+        if self.splitter:
+            chunks = [chunk for split in self.splitter.split_texts(texts) for chunk in split]
             logger.info(f"✅ Created {len(chunks)} chunks from conversation context.")
+        else:
+            chunks = texts
 
-        embeddings = [self.model.encode(chunk).tolist() for chunk in chunks]
+        embeddings = self.model.encode(chunks, batch_size=self.embed_batch_size).tolist()
         ids = [str(uuid.uuid4()) for _ in chunks]
         metadatas = [{"source": "user_conversation"} for _ in chunks]
 
         self.conversation_collection.add(ids=ids, documents=chunks, embeddings=embeddings, metadatas=metadatas)
+        self.conversation_collection.persist()
         logger.debug("🧩 Added conversation context to vector DB successfully.")
+        return len(chunks)
 
     def store_conversation(self, text: str):
+        embedding = self.model.encode([text])[0].tolist()
         self.conversation_collection.add(
             ids=[str(uuid.uuid4())],
             documents=[text],
+            embeddings=[embedding],
             metadatas=[{"type": "conversation", "source": "user"}],
         )
+        self.conversation_collection.persist()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from core.logger import logger
+from otel_setup import tracer, agent_latency
+
+
+class ActionNode:
+    def __init__(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.timeout = timeout
+
+
+class ActionGraph:
+    """
+    Small dependency graph of async actions for one turn. Every node starts as
+    soon as its dependencies finish, so independent branches run concurrently.
+
+    A node is called with its dependencies' results and only runs when all of
+    them produced a value; a node that fails, times out or returns None yields
+    None. Blocking work inside a node should go through a core.executor pool
+    (or `asyncio.to_thread`).
+    """
+    def __init__(self, default_timeout: Optional[float] = None):
+        self.default_timeout = default_timeout
+        self.nodes: Dict[str, ActionNode] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.nodes
+
+    def add(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = (),
+            timeout: Optional[float] = None) -> "ActionGraph":
+        deps = list(deps)
+        missing = [d for d in deps if d not in self.nodes]
+        if missing:
+            # Dependencies must be added first, which also rules out cycles
+            raise ValueError(f"Action '{name}' depends on unknown actions {missing}")
+        self.nodes[name] = ActionNode(name, fn, deps, timeout if timeout is not None else self.default_timeout)
+        return self
+
+    def start(self) -> "ActionGraph":
+        for name, node in self.nodes.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.create_task(self._run_node(node), name=f"action.{name}")
+        return self
+
+    async def _run_node(self, node: ActionNode) -> Any:
+        inputs = [await self._tasks[dep] for dep in node.deps]
+        if any(value is None for value in inputs):
+            logger.info(f"Skipping action '{node.name}': a dependency produced no result")
+            return None
+
+        with tracer.start_as_current_span(f"action.{node.name}") as span:
+            start = time.time()
+            status = "ok"
+            try:
+                return await asyncio.wait_for(node.fn(*inputs), timeout=node.timeout)
+            except asyncio.TimeoutError:
+                status = "timeout"
+                span.add_event("action_timeout", {"timeout.s": node.timeout})
+                logger.warning(f"⏱️ Action '{node.name}' timed out after {node.timeout}s")
+                return None
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            except Exception:
+                status = "error"
+                logger.exception(f"Action '{node.name}' failed")
+                return None
+            finally:
+                span.set_attribute("action.status", status)
+                agent_latency.record((time.time() - start) * 1000, {"action": node.name, "status": status})
+
+    async def result(self, name: str) -> Any:
+        """Wait for one action; unknown actions resolve to None."""
+        task = self._tasks.get(name)
+        return await task if task else None
+
+    async def results(self, names: Iterable[str]) -> List[Any]:
+        return list(await asyncio.gather(*(self.result(name) for name in names)))
+
+    async def join(self) -> Dict[str, Any]:
+        """Wait for every action, including ones nothing downstream is waiting on."""
+        values = await asyncio.gather(*self._tasks.values())
+        return dict(zip(self._tasks, values))
+
+    def cancel(self):
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
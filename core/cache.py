@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from otel_setup import cache_hits, cache_misses, cache_memory
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count. Hits, misses and the
+    approximate resident size of the cached values are exported as metrics
+    tagged with the cache `name`.
+    """
+    def __init__(self, name: str, maxsize: int = 1024, sizeof: Optional[Callable[[Any], int]] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._attrs = {"cache": name}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                cache_misses.add(1, self._attrs)
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+        cache_hits.add(1, self._attrs)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        size = self.sizeof(value)
+        freed = 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                freed += old[1]
+            self._data[key] = (value, size)
+            while len(self._data) > self.maxsize:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                freed += evicted_size
+            self.nbytes += size - freed
+        cache_memory.add(size - freed, self._attrs)
+
+    def clear(self):
+        with self._lock:
+            freed = self.nbytes
+            self._data.clear()
+            self.nbytes = 0
+        cache_memory.add(-freed, self._attrs)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, Tuple
+
+from otel_setup import context_tokens
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, close enough for English prompts to the Gemini models."""
+    return max(1, len(text) // 4)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _overlap(previous: str, text: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of `previous` that `text` starts with (0 if under min_overlap)."""
+    for k in range(min(max_overlap, len(previous), len(text)), min_overlap - 1, -1):
+        if previous.endswith(text[:k]):
+            return k
+    return 0
+
+
+class ContextPacker:
+    """
+    Turns the orchestrator's collected context (preference dicts and
+    {"content": [retrieved chunks]} entries) into a flat list of prompt sections:
+
+    - chunks retrieved for several research actions are merged by ID
+    - chunks below `min_similarity` are dropped
+    - the splitter's chunk overlap is trimmed where neighbouring chunks of the
+      same note are both selected, and near-duplicates (word-shingle Jaccard
+      above `dedup_threshold`) are skipped
+    - chunks are added by relevance until `token_budget` is spent
+
+    Preferences are always kept and count towards the budget.
+    """
+    def __init__(self, token_budget: int = 1500, min_similarity: float = 0.25, dedup_threshold: float = 0.8,
+                 min_overlap: int = 20, max_overlap: int = 200):
+        self.token_budget = token_budget
+        self.min_similarity = min_similarity
+        self.dedup_threshold = dedup_threshold
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+
+    def pack(self, context: List[Dict]) -> List[Dict]:
+        """Returns [{"content": text, "metadata": {"source": label}}] in prompt order."""
+        sections, chunks = self._flatten(context)
+        raw_tokens = sum(estimate_tokens(s["content"]) for s in sections) + sum(estimate_tokens(c["content"]) for c in chunks)
+        budget = self.token_budget - sum(estimate_tokens(s["content"]) for s in sections)
+
+        selected: List[Tuple[Dict, str, set]] = []
+        for chunk in self._ranked(chunks):
+            text = self._trim_overlap(chunk, selected)
+            if not text.strip():
+                continue
+            if text != chunk["content"] and len(text.strip()) < self.min_overlap:
+                continue  # only a sliver is left once the overlap with a selected neighbour is cut
+            shingles = _shingles(text)
+            if any(self._jaccard(shingles, other) >= self.dedup_threshold for _, _, other in selected):
+                continue
+            tokens = estimate_tokens(text)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            selected.append((chunk, text, shingles))
+
+        sections += [
+            {"content": text.strip(), "metadata": {"source": self._source(chunk)}}
+            for chunk, text, _ in selected
+        ]
+        context_tokens.record(raw_tokens, {"stage": "raw"})
+        context_tokens.record(sum(estimate_tokens(s["content"]) for s in sections), {"stage": "packed"})
+        return sections
+
+    def _flatten(self, context: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        sections, chunks, seen = [], [], set()
+        for item in context:
+            content = item.get("content")
+            if isinstance(content, list):
+                for chunk in content:
+                    key = chunk.get("id") or chunk.get("content")
+                    if key not in seen:
+                        seen.add(key)
+                        chunks.append(chunk)
+            elif content:
+                title = item.get("title")
+                sections.append({
+                    "content": str(content),
+                    "metadata": {"source": f"User preference: {title}" if title else "User preference"},
+                })
+        return sections, chunks
+
+    def _ranked(self, chunks: List[Dict]) -> List[Dict]:
+        kept = [c for c in chunks if c.get("similarity") is None or c["similarity"] >= self.min_similarity]
+        # Fused results carry an RRF "score"; plain dense/lexical ones only "similarity"
+        return sorted(kept, key=lambda c: c.get("score", c.get("similarity") or 0.0), reverse=True)
+
+    def _trim_overlap(self, chunk: Dict, selected: List[Tuple[Dict, str, set]]) -> str:
+        text = chunk["content"]
+        path = chunk.get("metadata", {}).get("path")
+        if path is None:
+            return text
+        for other, other_text, _ in selected:
+            if other.get("metadata", {}).get("path") != path:
+                continue
+            # This chunk continues one already selected: drop the repeated head
+            k = _overlap(other_text, text, self.min_overlap, self.max_overlap)
+            if k:
+                text = text[k:]
+                continue
+            # This chunk precedes one already selected: drop the repeated tail
+            k = _overlap(text, other_text, self.min_overlap, self.max_overlap)
+            if k:
+                text = text[:-k]
+        return text
+
+    @staticmethod
+    def _source(chunk: Dict) -> str:
+        metadata = chunk.get("metadata") or {}
+        return metadata.get("path") or metadata.get("source") or "Unknown"
+
+    @staticmethod
+    def _jaccard(a: set, b: set) -> float:
+        return len(a & b) / len(a | b) if a and b else 0.0
@@ -1,7 +1,7 @@
 import time
 from pydantic_ai import Agent
 import json, re
-from otel_setup import tracer, request_latency
+from otel_setup import tracer, request_latency, RECORD_INPUT_TEXT
 
 class ControllerAgent:
     
@@ -40,7 +40,13 @@ class ControllerAgent:
             output = getattr(result, "output", str(result))
             cleaned = re.sub(r"```(json)?", "", output).strip("` \n")
             try:
-                return json.loads(cleaned)
+                decision = json.loads(cleaned)
             except json.JSONDecodeError:
                 span.add_event("json_parse_failed")
                 return {"actions": ["chat"], "reason": "Default fallback"}
+
+            # What the intent router retrains on; input is already redacted, but only kept if opted in
+            if RECORD_INPUT_TEXT:
+                span.set_attribute("input.text", query)
+            span.set_attribute("controller.actions", [str(a) for a in decision.get("actions", [])])
+            return decision
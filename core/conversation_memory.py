@@ -1,23 +1,379 @@
+import os
 import json
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
 from core.logger import logger
+from otel_setup import memory_writes
+
+
+def _parse_lines(lines) -> List[Dict]:
+    """Decode JSONL records, skipping torn or corrupt lines left by a crash."""
+    records = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning("ConversationMemory: Skipping corrupt journal line")
+    return records
+
+
+def _read_tail(path: str, n: int, block_size: int = 64 * 1024) -> List[Dict]:
+    """Last `n` records of a JSONL file, reading backwards from the end in blocks."""
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if pos > 0:
+        lines = lines[1:]  # first line is partial
+    return _parse_lines(lines)[-n:]
+
+
+class Turn:
+    """One conversation record; slotted so a full window stays small."""
+    __slots__ = ("seq", "role", "content")
+
+    def __init__(self, seq: int, role: str, content: Any):
+        self.seq = seq
+        self.role = role
+        self.content = content
+
+    @classmethod
+    def from_record(cls, record: Dict) -> "Turn":
+        return cls(record.get("seq", 0), record.get("role"), record.get("content"))
+
+    def to_dict(self) -> Dict:
+        return {"seq": self.seq, "role": self.role, "content": self.content}
+
+
+class RollingSummary:
+    """
+    Bounded digest of every turn that left the window: a turn count plus the
+    most recent `max_facts` preferences (by title), rendered to at most
+    `max_chars` characters.
+    """
+    def __init__(self, max_facts: int = 50, max_chars: int = 2000):
+        self.max_facts = max_facts
+        self.max_chars = max_chars
+        self.turns = 0
+        self.through_seq = 0
+        self.facts: "OrderedDict[str, str]" = OrderedDict()
+
+    def fold(self, turn: Turn):
+        self.turns += 1
+        self.through_seq = max(self.through_seq, turn.seq)
+        content = turn.content
+        if turn.role == "preference" and isinstance(content, dict):
+            title = content.get("title") or content.get("content")
+            if title:
+                self.facts[title] = content.get("content") or title
+                self.facts.move_to_end(title)
+                while len(self.facts) > self.max_facts:
+                    self.facts.popitem(last=False)
+
+    @property
+    def text(self) -> str:
+        if not self.turns:
+            return ""
+        lines = [f"{self.turns} earlier messages."]
+        if self.facts:
+            lines.append("Known preferences:")
+            lines += [f"- {title}: {content}" for title, content in reversed(self.facts.items())]
+        return "\n".join(lines)[:self.max_chars]
+
+    def to_dict(self) -> Dict:
+        return {"turns": self.turns, "through_seq": self.through_seq, "facts": list(self.facts.items())}
+
+    @classmethod
+    def from_dict(cls, data: Dict, **kwargs) -> "RollingSummary":
+        summary = cls(**kwargs)
+        summary.turns = data.get("turns", 0)
+        summary.through_seq = data.get("through_seq", 0)
+        summary.facts = OrderedDict((title, content) for title, content in data.get("facts", []))
+        return summary
+
 
 class ConversationMemory:
-    def __init__(self, path="data/memory.json"):
+    """
+    Conversation history as an append-only JSONL journal plus a compacted
+    snapshot, both keyed by a monotonically increasing `seq`.
+
+    - add_message appends one line (O(1), no matter how long the history is)
+    - save flushes, and fsyncs once `fsync_every` records or `fsync_interval`
+      seconds have accumulated since the last fsync
+    - once the journal holds `compact_every` records it is appended to the
+      snapshot and truncated; records already in the snapshot are skipped on
+      recovery, so a crash at any point loses nothing that was fsynced
+    - startup reads only the last `window_size` records; `iter_history` streams the rest
+
+    In memory only a ring buffer of the last `window_size` turns is kept. Turns
+    pushed out of it are folded into a RollingSummary (persisted next to the
+    journal), and the journal doubles as the spillover store that `page` reads
+    older turns back from, so resident memory per session is constant.
+
+    A legacy memory.json at `path` is migrated into the snapshot on first start.
+    """
+    def __init__(self, path="data/memory.json", window_size: int = 50, fsync_every: int = 8,
+                 fsync_interval: float = 1.0, compact_every: int = 1000):
+        if window_size < 1:
+            raise ValueError(f"window_size must be at least 1, got {window_size}")
         self.path = path
-        self.messages = []
-        logger.info("ConversationMemory: Initialized and cleared.")
-        
+        base = path[:-len(".json")] if path.endswith(".json") else path
+        self.journal_path = f"{base}.journal.jsonl"
+        self.snapshot_path = f"{base}.snapshot.jsonl"
+        self.summary_path = f"{base}.summary.json"
+        self.window_size = window_size
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.time()
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+
+        self._migrate_legacy()
+        self._repair_tail(self.journal_path)
+        self._repair_tail(self.snapshot_path)
+        self.window: Deque[Turn] = deque(maxlen=window_size)
+        self.summary = self._load_summary()
+        self._summary_dirty = False
+        self._load_window()
+        self._seq = self._last_seq()
+        self._journal_records = self._count_lines(self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+        if self.window:
+            logger.info(f"ConversationMemory: Loaded last {len(self.window)} messages (seq {self._seq})")
+        else:
+            logger.info("ConversationMemory: No existing memory found. Starting fresh.")
+
+    # ------------------------------------------------------------------
+    # Startup / recovery
+    # ------------------------------------------------------------------
+    def _migrate_legacy(self):
+        if not os.path.exists(self.path) or os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path):
+            return
         try:
             with open(self.path, "r") as f:
-                data = json.load(f)
-                self.messages = data.get("messages", [])
+                messages = json.load(f).get("messages", [])
+        except json.JSONDecodeError:
+            logger.warning(f"ConversationMemory: Legacy {self.path} is corrupt, not migrating")
+            return
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for seq, message in enumerate(messages, start=1):
+                f.write(json.dumps({"seq": seq, **message}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        os.replace(self.path, f"{self.path}.migrated")
+        logger.info(f"ConversationMemory: Migrated {len(messages)} messages from {self.path}")
+
+    @staticmethod
+    def _repair_tail(path: str):
+        """Cut a torn last line (crash mid-append) so new records start on a clean line."""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    pos += newline + 1
+                    break
+            f.truncate(pos)
+        logger.warning(f"ConversationMemory: Dropped a torn record at the end of {path}")
+
+    def _read_last(self, n: int) -> List[Dict]:
+        """Last `n` records across snapshot + journal."""
+        journal = _read_tail(self.journal_path, n)
+        snapshot = _read_tail(self.snapshot_path, n)
+        # Journal records that were already compacted into the snapshot are duplicates
+        newest = snapshot[-1]["seq"] if snapshot else 0
+        journal = [r for r in journal if r.get("seq", 0) > newest]
+        return (snapshot + journal)[-n:]
+
+    def _load_window(self):
+        """Fill the window from the tail, folding any turns the persisted summary missed."""
+        last = self._read_last(1)
+        if not last:
+            return
+        # seqs are contiguous, so the records the summary hasn't seen are countable
+        unsummarized = max(last[-1]["seq"] - self.summary.through_seq, 0)
+        if unsummarized <= self.window_size:
+            records = self._read_last(unsummarized)
+        else:
+            # Large gap (legacy migration, lost summary): stream it instead of loading it
+            cutoff = last[-1]["seq"] - self.window_size
+            records = []
+            for record in self._iter_records():
+                if record["seq"] <= self.summary.through_seq:
+                    continue
+                if record["seq"] <= cutoff:
+                    self.summary.fold(Turn.from_record(record))
+                else:
+                    records.append(record)
+            self._save_summary()
+        self.window.extend(Turn.from_record(r) for r in records)
+
+    def _load_summary(self) -> RollingSummary:
+        try:
+            with open(self.summary_path, "r", encoding="utf-8") as f:
+                return RollingSummary.from_dict(json.load(f))
         except (FileNotFoundError, json.JSONDecodeError):
-            logger.info("ConversationMemory: No existing memory found. Starting fresh.")
+            return RollingSummary()
+
+    def _save_summary(self):
+        tmp_path = f"{self.summary_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary.to_dict(), f)
+        os.replace(tmp_path, self.summary_path)
+        self._summary_dirty = False
+
+    def _last_seq(self) -> int:
+        """Newest seq on disk: the journal's last record, else the snapshot's."""
+        last = _read_tail(self.journal_path, 1)
+        # After a crash between compaction and truncate the journal only holds older records
+        return max(last[-1]["seq"] if last else 0, self._last_snapshot_seq())
+
+    def _last_snapshot_seq(self) -> int:
+        last = _read_tail(self.snapshot_path, 1)
+        return last[-1]["seq"] if last else 0
 
+    @staticmethod
+    def _count_lines(path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
     def add_message(self, role, content):
-        self.messages.append({"role": role, "content": content})
+        with self._lock:
+            self._seq += 1
+            turn = Turn(self._seq, role, content)
+            self._journal.write(json.dumps(turn.to_dict()) + "\n")
+            self._journal_records += 1
+            self._unsynced += 1
+            if len(self.window) == self.window.maxlen:
+                self.summary.fold(self.window[0])
+                self._summary_dirty = True
+            self.window.append(turn)
+        memory_writes.add(1, {"store": "journal"})
 
     def save(self):
-        with open(self.path, "w") as f:
-            json.dump({"messages": self.messages}, f, indent=2)
+        """Make the appended records durable; fsyncs are batched across calls."""
+        with self._lock:
+            self._journal.flush()
+            due = self._unsynced >= self.fsync_every or time.time() - self._last_sync >= self.fsync_interval
+            if self._unsynced and due:
+                self._fsync()
+            if self._summary_dirty:
+                self._save_summary()
+            if self._journal_records >= self.compact_every:
+                self._compact()
         logger.info("ConversationMemory: Saved to disk ✅")
+
+    def sync(self):
+        with self._lock:
+            self._journal.flush()
+            if self._unsynced:
+                self._fsync()
+
+    def _fsync(self):
+        os.fsync(self._journal.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def _compact(self):
+        """Append the journal to the snapshot, then truncate it (caller holds the lock)."""
+        self._fsync()
+        # A failed earlier append must not glue its fragment onto this one's first record
+        self._repair_tail(self.snapshot_path)
+        last_seq = self._last_snapshot_seq()
+        with open(self.journal_path, "r", encoding="utf-8") as journal, \
+                open(self.snapshot_path, "a", encoding="utf-8") as snapshot:
+            for record in _parse_lines(journal):
+                if record.get("seq", 0) > last_seq:
+                    snapshot.write(json.dumps(record) + "\n")
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        # A crash before this truncate only leaves records recovery already skips
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        os.fsync(self._journal.fileno())
+        logger.info(f"ConversationMemory: Compacted {self._journal_records} journal records into the snapshot")
+        self._journal_records = 0
+
+    def close(self):
+        self.sync()
+        self._journal.close()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def iter_history(self) -> Iterator[Dict]:
+        """Stream the full history, oldest first, without loading it all."""
+        self.sync()
+        return self._iter_records()
+
+    def _iter_records(self) -> Iterator[Dict]:
+        last_seq = 0
+        for path in (self.snapshot_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    for record in _parse_lines([line]):
+                        if record.get("seq", 0) > last_seq:
+                            last_seq = record["seq"]
+                            yield record
+
+    @property
+    def messages(self) -> List[Dict]:
+        """The in-memory window as plain dicts, oldest first."""
+        return self.recent()
+
+    def recent(self, n: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            turns = list(self.window)
+        return [t.to_dict() for t in (turns[-n:] if n else turns)]
+
+    def page(self, before_seq: int, limit: int = 50) -> List[Dict]:
+        """Up to `limit` turns older than `before_seq`, paged in from the journal/snapshot."""
+        self.sync()
+        distance = self._seq - before_seq + 1
+        if before_seq <= 1 or distance < 0:
+            return []
+        records = self._read_last(distance + limit)
+        return [r for r in records if r.get("seq", 0) < before_seq][-limit:]
+
+    def context(self) -> Dict:
+        """What a prompt needs: the rolling summary of older turns plus the recent window."""
+        return {"summary": self.summary.text, "recent": self.recent()}
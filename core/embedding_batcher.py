@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, List, Optional
+
+import numpy as np
+
+from core.logger import logger
+from otel_setup import embedding_batch_size, embedding_queue_delay
+
+
+class EmbeddingRequest:
+    __slots__ = ("texts", "future", "queued")
+
+    def __init__(self, texts: List[str], future: Future, queued: float):
+        self.texts = texts
+        self.future = future
+        self.queued = queued
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batches concurrent encode calls (e.g. several sessions retrieving at
+    once). The first waiting request opens a window of `window_ms`, closed early
+    once `max_batch` texts are queued; everything collected is encoded in one
+    forward pass and each caller gets its own rows back.
+
+    `encode` blocks the calling thread, `aencode` awaits without holding one.
+    window_ms <= 0 turns batching off and encodes inline.
+    """
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], window_ms: float = 2.0, max_batch: int = 64):
+        self._encode = encode
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+
+        self._queue: Deque[EmbeddingRequest] = deque()
+        self._queued_texts = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.window_ms <= 0:
+            embedding_batch_size.record(len(texts))
+            return np.asarray(self._encode(list(texts)))
+        return self.submit(texts).result()
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._queue.append(EmbeddingRequest(list(texts), future, time.time()))
+            self._queued_texts += len(texts)
+            self._cond.notify_all()
+        return future
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                deadline = self._queue[0].queued + self.window_ms / 1000
+                while self._queued_texts < self.max_batch and not self._closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                # Whole requests only; one oversized request still goes through on its own
+                batch: List[EmbeddingRequest] = []
+                size = 0
+                while self._queue and (not batch or size + len(self._queue[0].texts) <= self.max_batch):
+                    request = self._queue.popleft()
+                    batch.append(request)
+                    size += len(request.texts)
+                self._queued_texts -= size
+
+            self._run_batch(batch, size)
+
+    def _run_batch(self, batch: List[EmbeddingRequest], size: int):
+        start = time.time()
+        for request in batch:
+            embedding_queue_delay.record((start - request.queued) * 1000)
+        embedding_batch_size.record(size)
+
+        try:
+            embeddings = np.asarray(self._encode([text for request in batch for text in request.texts]))
+        except Exception as e:
+            logger.exception(f"Embedding batch of {size} texts failed")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(embeddings[offset:offset + len(request.texts)])
+            offset += len(request.texts)
@@ -0,0 +1,73 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from core.logger import logger
+from otel_setup import executor_queue_depth, executor_wait
+
+# Worker threads per pool. Model inference (torch, numpy, spaCy) releases the
+# GIL, so threads scale with cores without copying the models into processes.
+# Guardrails get their own pool so input scans never queue behind retrieval.
+POOL_SIZES = {
+    "rag": min(4, os.cpu_count() or 1),
+    "guardrails": 2,
+}
+
+
+class BlockingExecutor:
+    """
+    Sized thread pool for CPU-bound and blocking calls made from async code.
+    Unlike asyncio.to_thread (the loop's shared default executor), each pool has
+    a fixed width, and reports how many calls are waiting for a worker and how
+    long they waited.
+    """
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._attrs = {"pool": name}
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        submitted = time.time()
+        executor_queue_depth.add(1, self._attrs)
+
+        def call():
+            executor_queue_depth.add(-1, self._attrs)
+            executor_wait.record((time.time() - submitted) * 1000, self._attrs)
+            return fn(*args, **kwargs)
+
+        def _on_done(f):
+            # A caller cancelled (timeout, graph.cancel) before a worker picked the call up: it never runs
+            if f.cancelled():
+                executor_queue_depth.add(-1, self._attrs)
+
+        # Carry the caller's context (current span) into the worker, as to_thread does
+        context = contextvars.copy_context()
+        future = self._pool.submit(partial(context.run, call))
+        future.add_done_callback(_on_done)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+_executors: Dict[str, BlockingExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str, max_workers: Optional[int] = None) -> BlockingExecutor:
+    """Process-wide pool for `name`, created on first use with POOL_SIZES[name] workers."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                size = max_workers or POOL_SIZES.get(name) or (os.cpu_count() or 1)
+                executor = _executors[name] = BlockingExecutor(name, size)
+                logger.info(f"Executor '{name}' started with {size} workers")
+    return executor
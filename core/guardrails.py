@@ -1,11 +1,39 @@
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine, OperatorConfig
-from core.presidio_engine import create_presidio_analyzer
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, List, Optional
+
 from core.logger import logger
+from core.cache import LRUCache
+from core.executor import get_executor
+from otel_setup import guardrail_latency, stream_redaction_latency, stream_redaction_hold
+
+# Engines are built once, on first use (Presidio loads a spaCy pipeline)
+_analyzer = None
+_anonymizer = None
+_engine_lock = threading.Lock()
+
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _engine_lock:
+            if _analyzer is None:
+                from core.presidio_engine import create_presidio_analyzer
+                _analyzer = create_presidio_analyzer()
+    return _analyzer
 
-# Initialize engines once
-analyzer: AnalyzerEngine = create_presidio_analyzer()
-anonymizer = AnonymizerEngine()
+
+def get_anonymizer():
+    global _anonymizer
+    if _anonymizer is None:
+        with _engine_lock:
+            if _anonymizer is None:
+                from presidio_anonymizer import AnonymizerEngine
+                _anonymizer = AnonymizerEngine()
+    return _anonymizer
 
 # Explicit PII whitelist (chat-safe)
 PII_ENTITIES = {
@@ -23,6 +51,117 @@ PII_ENTITIES = {
 PII_SCORE_THRESHOLD = 0.85
 
 
+# Cheap candidate test run before Presidio. Every entity in PII_ENTITIES is
+# pattern/checksum based, so text that matches none of these can't contain one.
+PII_CANDIDATE_PATTERN = re.compile(
+    r"@"                                                    # email
+    r"|(?:\d[\s().\-/]*){7,}"                               # phone, card, SSN, passport, licence
+    r"|\b[A-Za-z]{2}\d{2}\s?[A-Za-z0-9]{4}"                 # IBAN prefix
+    r"|\b\d{1,3}(?:\.\d{1,3}){3}\b"                         # IPv4
+    r"|[0-9A-Fa-f]{0,4}:[0-9A-Fa-f]{0,4}:[0-9A-Fa-f]{0,4}"  # IPv6
+)
+
+
+class PIIScan:
+    """Result of one guardrail pass: the detected entities and the redacted text."""
+    __slots__ = ("entities", "text")
+
+    def __init__(self, entities: List, text: str):
+        self.entities = entities
+        self.text = text
+
+    @property
+    def found(self) -> bool:
+        return bool(self.entities)
+
+
+class GuardrailEngine:
+    """
+    Single-pass PII guardrail: a regex prefilter skips Presidio entirely for
+    text with no candidate span, otherwise the analyzer runs once and its
+    results feed both detection and redaction. Scans are cached by text hash.
+    """
+    def __init__(self, cache_size: int = 1024):
+        self.cache = LRUCache("pii_scan", maxsize=cache_size, sizeof=lambda scan: len(scan.text))
+
+    def load(self) -> "GuardrailEngine":
+        """Build the Presidio engines now instead of on the first suspicious input."""
+        get_analyzer()
+        get_anonymizer()
+        return self
+
+    @staticmethod
+    def has_candidates(text: str) -> bool:
+        return PII_CANDIDATE_PATTERN.search(text) is not None
+
+    def scan(self, text: str) -> PIIScan:
+        if not text or not isinstance(text, str):
+            return PIIScan([], text)
+
+        start = time.time()
+        if not self.has_candidates(text):
+            guardrail_latency.record((time.time() - start) * 1000, {"path": "prefilter"})
+            return PIIScan([], text)
+
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        scan = self.cache.get(key)
+        if scan is not None:
+            guardrail_latency.record((time.time() - start) * 1000, {"path": "cache"})
+            return scan
+
+        scan = self._analyze(text)
+        self.cache.put(key, scan)
+        guardrail_latency.record((time.time() - start) * 1000, {"path": "analyzer"})
+        return scan
+
+    async def ascan(self, text: str) -> PIIScan:
+        """`scan` for async callers: the prefilter runs inline, analyzer passes on the "guardrails" executor."""
+        if not text or not isinstance(text, str) or not self.has_candidates(text):
+            return self.scan(text)
+        return await get_executor("guardrails").run(self.scan, text)
+
+    def _analyze(self, text: str) -> PIIScan:
+        results = get_analyzer().analyze(
+            text=text,
+            language="en",
+            entities=sorted(PII_ENTITIES),
+            score_threshold=PII_SCORE_THRESHOLD,
+        )
+        pii_results = [r for r in results if r.entity_type in PII_ENTITIES]
+        logger.debug(f"PII detected: {pii_results}")
+
+        if not pii_results:
+            return PIIScan([], text)
+
+        from presidio_anonymizer import OperatorConfig
+
+        anonymized = get_anonymizer().anonymize(
+            text=text,
+            analyzer_results=pii_results,
+            operators={
+                "DEFAULT": OperatorConfig(
+                    operator_name="replace",
+                    params={"new_value": "<PII_REDACTED>"}
+                )
+            }
+        )
+
+        logger.info(f"Redacted text: {anonymized.text}")
+        return PIIScan(pii_results, anonymized.text)
+
+
+_guardrail_engine: Optional[GuardrailEngine] = None
+
+
+def get_guardrail_engine() -> GuardrailEngine:
+    global _guardrail_engine
+    if _guardrail_engine is None:
+        with _engine_lock:
+            if _guardrail_engine is None:
+                _guardrail_engine = GuardrailEngine()
+    return _guardrail_engine
+
+
 def detect_pii(text: str):
     """
     Detects high-confidence PII entities in text.
@@ -30,20 +169,7 @@ def detect_pii(text: str):
     """
     if not text or not isinstance(text, str):
         return []
-
-    results = analyzer.analyze(
-        text=text,
-        language="en",
-        score_threshold=PII_SCORE_THRESHOLD,
-    )
-
-    pii_results = [
-        r for r in results
-        if r.entity_type in PII_ENTITIES
-    ]
-
-    logger.debug(f"PII detected: {pii_results}")
-    return pii_results
+    return get_guardrail_engine().scan(text).entities
 
 
 def redact_pii(text: str) -> str:
@@ -53,22 +179,178 @@ def redact_pii(text: str) -> str:
     """
     if not text or not isinstance(text, str):
         return text
+    return get_guardrail_engine().scan(text).text
+
 
-    pii_results = detect_pii(text)
+async def adetect_pii(text: str):
+    if not text or not isinstance(text, str):
+        return []
+    return (await get_guardrail_engine().ascan(text)).entities
 
-    if not pii_results:
+
+async def aredact_pii(text: str) -> str:
+    if not text or not isinstance(text, str):
         return text
+    return (await get_guardrail_engine().ascan(text)).text
+
+
+# Places a streamed answer may be cut for scanning: sentence ends, and (once the
+# buffer is over budget) plain whitespace
+SENTENCE_BOUNDARY = re.compile(r"[.!?][\"')\]]*\s+|\n+")
+WORD_BOUNDARY = re.compile(r"\s+")
+
+# A token at the end of the buffer that may still grow into a PII candidate
+CANDIDATE_PREFIX = re.compile(
+    r"(?:\b[A-Za-z]{2}\d{2}\s?[A-Za-z0-9]{0,3}"  # IBAN country code + check digits
+    r"|(?:\d[\s().\-/]*)+"                     # digits of a phone, card or ID number
+    r"|\S*[@:]\S*)$"                            # email or IPv6 address
+)
+
+
+class StreamingRedactor:
+    """
+    Output-side guardrail for streamed answers. Deltas are buffered only up to
+    the next sentence boundary that doesn't split a PII candidate; that window
+    is scanned (usually just the regex prefilter) and emitted redacted.
+
+    A window is forced out at a word boundary once it exceeds `max_buffer`
+    characters or has been held for `max_hold_ms`, so the delay added to any
+    piece of text stays bounded; `redact` also releases it when the model
+    stalls for that long. A trailing token that could still grow into a
+    candidate is held back until `max_buffer` is reached.
+    """
+    def __init__(self, engine: Optional[GuardrailEngine] = None, max_buffer: int = 400, max_hold_ms: float = 250):
+        self.engine = engine or get_guardrail_engine()
+        self.max_buffer = max_buffer
+        self.max_hold_ms = max_hold_ms
+        self._buffer = ""
+        self._held_since = 0.0
+
+    @staticmethod
+    def _hold_from(text: str, spans: List[tuple]) -> int:
+        """Start of a trailing candidate (or possible candidate prefix), else len(text)."""
+        hold = len(text)
+        prefix = CANDIDATE_PREFIX.search(text)
+        if prefix:
+            hold = prefix.start()
+        # Candidates are held together with any that directly follow them (IBAN groups, numbers)
+        for s, e in reversed(spans):
+            if s < hold and (e >= hold or not text[e:hold].strip()):
+                hold = s
+        return hold
+
+    def _cut(self, text: str, boundary: re.Pattern) -> int:
+        """End of the last boundary that is safe to cut at, or 0."""
+        spans = [m.span() for m in PII_CANDIDATE_PATTERN.finditer(text)]
+        hold = self._hold_from(text, spans)
+        cut = 0
+        for m in boundary.finditer(text):
+            end = m.end()
+            # Only cut once we've seen what follows, and never through a number, a candidate
+            # span or a trailing token that may still become one
+            if end >= len(text) or end > hold or text[end].isdigit() or any(s < end < e for s, e in spans):
+                continue
+            cut = end
+        return cut
+
+    def _next_window(self, final: bool = False, stalled: bool = False) -> Optional[str]:
+        """
+        Take the next window off the buffer, or None to keep holding. `stalled`
+        means no delta arrived within max_hold_ms, so what follows is unknown.
+        """
+        text = self._buffer
+        if not text:
+            return None
+        if final:
+            cut = len(text)
+        else:
+            cut = self._cut(text, SENTENCE_BOUNDARY)
+            held_ms = (time.time() - self._held_since) * 1000
+            if not cut and (len(text) >= self.max_buffer or held_ms >= self.max_hold_ms):
+                spans = [m.span() for m in PII_CANDIDATE_PATTERN.finditer(text)]
+                cut = self._hold_from(text, spans) if stalled else self._cut(text, WORD_BOUNDARY)
+                if not cut and len(text) >= self.max_buffer:
+                    # Keep a candidate still growing at the end, emit everything before it
+                    cut = self._hold_from(text, spans) or len(text)
+        if not cut:
+            return None
+
+        window, self._buffer = text[:cut], text[cut:]
+        stream_redaction_hold.record((time.time() - self._held_since) * 1000)
+        self._held_since = time.time()
+        return window
+
+    def _scan(self, window: str) -> str:
+        start = time.time()
+        text = self.engine.scan(window).text
+        stream_redaction_latency.record((time.time() - start) * 1000)
+        return text
+
+    def _append(self, delta: str):
+        if not self._buffer:
+            self._held_since = time.time()
+        self._buffer += delta
+
+    def feed(self, delta: str) -> str:
+        """Add a delta; returns the redacted text that is safe to emit now (possibly empty)."""
+        self._append(delta)
+        out = []
+        window = self._next_window()
+        while window:
+            out.append(self._scan(window))
+            window = self._next_window()
+        return "".join(out)
+
+    def flush(self) -> str:
+        window = self._next_window(final=True)
+        return self._scan(window) if window else ""
+
+    async def redact(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Redact an async stream of deltas; analyzer passes run off the event loop."""
+        deltas = deltas.__aiter__()
+        pending = None
+        stalled = False
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(self._next_delta(deltas))
+                timeout = None
+                if self._buffer and not stalled:
+                    timeout = max(0.0, self.max_hold_ms / 1000 - (time.time() - self._held_since))
+                try:
+                    delta = await asyncio.wait_for(asyncio.shield(pending), timeout)
+                except asyncio.TimeoutError:
+                    # The model stalled: release what's held instead of waiting for its next token
+                    window = self._next_window(stalled=True)
+                    if window:
+                        yield await self._scan_async(window)
+                    else:
+                        stalled = True  # only a possible candidate is left; wait for more
+                    continue
+                pending = None
+                stalled = False
+                if delta is None:
+                    break
+                self._append(delta)
+                window = self._next_window()
+                while window:
+                    yield await self._scan_async(window)
+                    window = self._next_window()
+        finally:
+            if pending is not None:
+                pending.cancel()
+        window = self._next_window(final=True)
+        if window:
+            yield await self._scan_async(window)
+
+    @staticmethod
+    async def _next_delta(deltas: AsyncIterator[str]) -> Optional[str]:
+        try:
+            return await deltas.__anext__()
+        except StopAsyncIteration:
+            return None
 
-    anonymized = anonymizer.anonymize(
-        text=text,
-        analyzer_results=pii_results,
-        operators={
-            "DEFAULT": OperatorConfig(
-                operator_name="replace",
-                params={"new_value": "<PII_REDACTED>"}
-            )
-        }
-    )
-
-    logger.info(f"Redacted text: {anonymized.text}")
-    return anonymized.text
+    async def _scan_async(self, window: str) -> str:
+        if not self.engine.has_candidates(window):
+            return self._scan(window)
+        return await get_executor("guardrails").run(self._scan, window)
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.logger import logger
+
+CHUNK_SIZE = 400
+CHUNK_OVERLAP = 50
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of a note's content, used to detect edits between runs."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(path: str, doc_hash: str, index: int) -> str:
+    """Deterministic chunk ID so re-ingesting the same file version is an idempotent upsert."""
+    return hashlib.sha1(f"{path}:{doc_hash}:{index}".encode("utf-8")).hexdigest()
+
+
+class IngestionManifest:
+    """
+    Persisted record of the note files already ingested into the knowledge base,
+    keyed by file path and storing the content hash and the chunk IDs produced.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+
+        try:
+            with open(self.path, "r") as f:
+                self.files = json.load(f).get("files", {})
+        except FileNotFoundError:
+            logger.info("IngestionManifest: No manifest found, all notes will be ingested.")
+        except json.JSONDecodeError:
+            logger.warning("IngestionManifest: Manifest is corrupt, all notes will be re-ingested.")
+
+    def paths(self) -> List[str]:
+        return list(self.files)
+
+    def hash_for(self, path: str) -> Optional[str]:
+        entry = self.files.get(path)
+        return entry["hash"] if entry else None
+
+    def chunk_ids(self, path: str) -> List[str]:
+        entry = self.files.get(path)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, path: str, doc_hash: str, chunk_ids: List[str]):
+        self.files[path] = {"hash": doc_hash, "chunk_ids": chunk_ids}
+
+    def remove(self, path: str):
+        self.files.pop(path, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=2)
+        # Atomic swap so a crash mid-write never leaves a half-written manifest
+        os.replace(tmp_path, self.path)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most `size` items without materialising it."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ----------------------------------------------------------------------
+# Parallel chunking (bulk ingest)
+# ----------------------------------------------------------------------
+_worker_splitter = None
+
+
+def _init_split_worker(chunk_size: int, chunk_overlap: int):
+    """Load the spaCy pipeline once per worker process."""
+    global _worker_splitter
+    from core.nlp import SentenceTextSplitter, get_nlp_registry
+
+    _worker_splitter = SentenceTextSplitter(
+        get_nlp_registry().view("chunking"), chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+
+def _split_batch(texts: List[str], nlp_batch_size: int) -> List[List[str]]:
+    """Split a batch of documents with a single nlp.pipe pass, merging sentences into chunks."""
+    return _worker_splitter.split_texts(texts, batch_size=nlp_batch_size)
+
+
+class ParallelChunker:
+    """
+    Process pool that splits documents into chunks. Documents are shipped to the
+    workers in groups of `docs_per_task` and split through `nlp.pipe`; at most
+    two tasks per worker are in flight so memory stays bounded on large trees.
+    """
+    def __init__(self, workers: int, docs_per_task: int = 64, nlp_batch_size: int = 32,
+                 chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.workers = workers
+        self.docs_per_task = docs_per_task
+        self.nlp_batch_size = nlp_batch_size
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_split_worker,
+            initargs=(chunk_size, chunk_overlap),
+        )
+
+    def split(self, notes: Iterable[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, List[str]]]:
+        """Map (path, doc, doc_hash) to (path, doc_hash, chunks), preserving input order."""
+        in_flight = deque()
+        for batch in batched(notes, self.docs_per_task):
+            texts = [doc for _, doc, _ in batch]
+            in_flight.append((batch, self.pool.submit(_split_batch, texts, self.nlp_batch_size)))
+            if len(in_flight) >= self.workers * 2:
+                yield from self._drain_one(in_flight)
+        while in_flight:
+            yield from self._drain_one(in_flight)
+
+    def _drain_one(self, in_flight: deque):
+        batch, future = in_flight.popleft()
+        for (path, _, doc_hash), chunks in zip(batch, future.result()):
+            yield path, doc_hash, chunks
+
+    def close(self):
+        self.pool.shutdown()
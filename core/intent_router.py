@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.logger import logger
+from core.executor import get_executor
+from otel_setup import tracer, router_decisions, router_agreement, request_latency
+
+ACTIONS = ("research", "preferences", "quit")
+CONTROLLER_SPANS = {"ControllerAgent.decide_action", "PlannerAgent.decide_action"}
+
+# Cold-start examples per label, in the spirit of the controller prompt; replaced
+# by real decisions as soon as traces or live fallbacks are available
+SEED_EXAMPLES = {
+    "research": [
+        "What recipes do I have with chickpeas?",
+        "How often should I water a snake plant?",
+        "Can you recommend a good documentary?",
+        "What did I write about sourdough starters?",
+        "Explain how compound interest works",
+    ],
+    "preferences": [
+        "I love spicy food",
+        "I don't like horror movies",
+        "I work as a nurse on night shifts",
+        "My favourite plant is the monstera",
+        "I usually go running in the morning",
+    ],
+    "preferences+research": [
+        "I like cats and eagles. Can you suggest a good documentary about them?",
+        "I love Bollywood dance movies, can you suggest some?",
+        "I'm vegetarian, what can I cook tonight?",
+        "I enjoy hiking, which trails should I try?",
+    ],
+    "quit": [
+        "quit",
+        "exit",
+        "bye, that's all for now",
+        "goodbye",
+    ],
+}
+
+
+def label_for(actions: Iterable[str]) -> Optional[str]:
+    """Canonical label for an action set; None when it contains actions the router doesn't learn."""
+    actions = sorted(set(actions))
+    if not actions or any(a not in ACTIONS for a in actions):
+        return None
+    return "+".join(actions)
+
+
+def iter_trace_decisions(path: str) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yield (redacted input, actions) from controller/planner spans in an OTLP JSON-lines
+    file, as written by the collector's `file` exporter (see otel_collector.yaml).
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        if span.get("name") not in CONTROLLER_SPANS:
+                            continue
+                        attrs = {a["key"]: _otlp_value(a.get("value", {})) for a in span.get("attributes", [])}
+                        if attrs.get("input.text") and attrs.get("controller.actions"):
+                            yield attrs["input.text"], attrs["controller.actions"]
+
+
+def _otlp_value(value: Dict):
+    if "arrayValue" in value:
+        return [_otlp_value(v) for v in value["arrayValue"].get("values", [])]
+    for key in ("stringValue", "intValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+class IntentRouter:
+    """
+    Nearest-centroid intent classifier over query embeddings. Each label (an
+    action set such as "preferences+research") keeps the running sum of its
+    examples' unit embeddings; a query is routed locally when its best cosine
+    similarity clears `threshold` and beats the runner-up by `margin`, and is
+    otherwise left to the LLM controller, whose decision is learned from.
+
+    `encode` maps a list of texts to embeddings; the orchestrator passes
+    RAGSystem.embed_queries so the router shares the retrieval embedding cache.
+
+    A `shadow_rate` fraction of locally routed turns is also sent to the LLM in
+    the background, so agreement is measured on confident routes too. Learned
+    fallbacks are saved at most every `save_delay` seconds, off the event loop.
+    """
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], path: Optional[str] = "./data/intent_router.npz",
+                 threshold: float = 0.6, margin: float = 0.08, shadow_rate: float = 0.05, save_delay: float = 5.0):
+        self.encode = encode
+        self.path = path
+        self.threshold = threshold
+        self.margin = margin
+        self.shadow_rate = shadow_rate
+        self.save_delay = save_delay
+
+        self.labels: List[str] = []
+        self.sums = np.zeros((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._shadow_tasks: set = set()
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+        if path and os.path.exists(path):
+            self._load(path)
+        else:
+            self.fit((text, label.split("+")) for label, texts in SEED_EXAMPLES.items() for text in texts)
+
+    # ------------------------------------------------------------------
+    # Training
+    # ------------------------------------------------------------------
+    def fit(self, examples: Iterable[Tuple[str, List[str]]], batch_size: int = 256) -> int:
+        """Add labelled examples to the centroids; returns how many were used."""
+        used = 0
+        batch: List[Tuple[str, str]] = []
+        for text, actions in examples:
+            label = label_for(actions)
+            if label is None or not text:
+                continue
+            batch.append((text, label))
+            if len(batch) >= batch_size:
+                used += self._add_batch(batch)
+                batch = []
+        if batch:
+            used += self._add_batch(batch)
+        return used
+
+    def _add_batch(self, batch: List[Tuple[str, str]]) -> int:
+        self._add([label for _, label in batch], self.encode([text for text, _ in batch]))
+        return len(batch)
+
+    def _add(self, labels: List[str], embeddings: np.ndarray):
+        embeddings = self._unit(embeddings)
+        with self._lock:
+            for label, emb in zip(labels, embeddings):
+                if label not in self.labels:
+                    self.labels.append(label)
+                    self.sums = np.vstack([self.sums.reshape(-1, len(emb)), np.zeros((1, len(emb)), dtype=np.float32)])
+                    self.counts = np.append(self.counts, 0)
+                i = self.labels.index(label)
+                self.sums[i] += emb
+                self.counts[i] += 1
+            self.centroids = self._unit(self.sums)
+
+    def observe(self, text: str, actions: List[str], embedding: Optional[np.ndarray] = None):
+        """Learn from one LLM decision (used on every fallback)."""
+        label = label_for(actions)
+        if label is None:
+            return
+        if embedding is None:
+            embedding = self.encode([text])[0]
+        self._add([label], embedding[None, :])
+
+    def train_from_traces(self, path: str) -> int:
+        used = self.fit(iter_trace_decisions(path))
+        logger.info(f"IntentRouter: Trained on {used} controller decisions from {path}")
+        return used
+
+    @staticmethod
+    def _unit(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+    def classify(self, embedding: np.ndarray) -> Tuple[Optional[str], float, float]:
+        """(best label, similarity, margin over the runner-up) for one query embedding."""
+        with self._lock:
+            if not self.labels:
+                return None, 0.0, 0.0
+            sims = self.centroids @ self._unit(embedding)
+        order = np.argsort(-sims)
+        best = float(sims[order[0]])
+        runner_up = float(sims[order[1]]) if len(order) > 1 else -1.0
+        return self.labels[order[0]], best, best - runner_up
+
+    async def decide(self, query: str, controller) -> Dict:
+        """Same contract as ControllerAgent.decide_action, answered locally when confident."""
+        with tracer.start_as_current_span("IntentRouter.decide") as span:
+            start = time.time()
+            embedding = (await get_executor("rag").run(self.encode, [query]))[0]
+            label, similarity, margin = self.classify(embedding)
+            span.set_attribute("router.similarity", similarity)
+            span.set_attribute("router.margin", margin)
+
+            if label and similarity >= self.threshold and margin >= self.margin:
+                duration = (time.time() - start) * 1000
+                request_latency.record(duration, {"component": "intent_router"})
+                router_decisions.add(1, {"path": "local", "label": label})
+                span.set_attribute("router.path", "local")
+                logger.info(f"🧭 Routed locally to {label} (similarity {similarity:.2f}, {duration:.1f} ms)")
+                if self.shadow_rate and random.random() < self.shadow_rate:
+                    self._shadow_check(query, label, controller)
+                return {"actions": label.split("+"), "reason": f"Local intent router ({similarity:.2f})"}
+
+            router_decisions.add(1, {"path": "fallback"})
+            span.set_attribute("router.path", "fallback")
+            decision = await controller.decide_action(query)
+            llm_label = label_for(decision.get("actions", []))
+            if label and llm_label:
+                router_agreement.add(1, {"agree": label == llm_label, "path": "fallback"})
+            if llm_label:
+                self.observe(query, decision["actions"], embedding)
+                self._schedule_save()
+            return decision
+
+    def _shadow_check(self, query: str, label: str, controller):
+        """Ask the LLM in the background too, so agreement is also measured on confident routes."""
+        async def check():
+            decision = await controller.decide_action(query)
+            llm_label = label_for(decision.get("actions", []))
+            if llm_label:
+                router_agreement.add(1, {"agree": label == llm_label, "path": "shadow"})
+
+        task = asyncio.create_task(check(), name="intent_router.shadow")
+        self._shadow_tasks.add(task)
+        task.add_done_callback(self._shadow_tasks.discard)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _schedule_save(self):
+        """Coalesce the saves of a burst of fallbacks into one npz write on the executor."""
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later(), name="intent_router.save")
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        while self._dirty:
+            self._dirty = False
+            await get_executor("rag").run(self.save)
+
+    def close(self):
+        """Write out anything learned since the last save."""
+        if self._dirty:
+            self._dirty = False
+            self.save()
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        with self._lock:
+            np.savez(tmp_path, labels=np.array(self.labels, dtype=np.str_), sums=self.sums, counts=self.counts)
+        os.replace(tmp_path, path)
+
+    def _load(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.labels = data["labels"].tolist()
+            self.sums = data["sums"].astype(np.float32)
+            self.counts = data["counts"]
+        self.centroids = self._unit(self.sums)
+        logger.info(f"IntentRouter: Loaded {len(self.labels)} intents ({int(self.counts.sum())} examples) from {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the intent router from exported controller traces")
+    parser.add_argument("traces", help="OTLP JSON-lines file written by the collector's file exporter")
+    parser.add_argument("--output", default="./data/intent_router.npz")
+    args = parser.parse_args()
+
+    from core.RAGSystem import RAGSystem
+
+    # Rebuild from the seeds plus every logged decision (live fallbacks are in the traces too)
+    router = IntentRouter(RAGSystem().embed_queries, path=None)
+    router.train_from_traces(args.traces)
+    router.save(args.output)
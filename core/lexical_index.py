@@ -0,0 +1,219 @@
+import os
+import re
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from core.logger import logger
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does for from give how i in is it me my of on or
+please recommend some suggest tell that the their them there these this to was what when
+where which who why will with would you your about any good
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Compact in-process BM25 inverted index over the knowledge collection.
+
+    Postings are stored CSR-style in flat numpy arrays (term -> slice of doc
+    indices and term frequencies) instead of dicts of lists. A forward index in
+    the same layout is kept so the inverted arrays can be rebuilt vectorised
+    after writes, and deletions are tombstoned until the next compaction.
+
+    Thread-safe: writes and the rebuild run under one lock, and every rebuild
+    swaps in fresh arrays, so a search works on a consistent snapshot of them.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.vocab: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self.id_to_doc: Dict[str, int] = {}
+
+        # Forward index: doc -> (term ids, term frequencies)
+        self.fwd_indptr = np.zeros(1, dtype=np.int64)
+        self.fwd_terms = np.zeros(0, dtype=np.int32)
+        self.fwd_tfs = np.zeros(0, dtype=np.int32)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        self.alive = np.zeros(0, dtype=bool)
+        self.doc_len = np.zeros(0, dtype=np.int32)
+
+        # Inverted index: term -> (doc indices, term frequencies)
+        self.inv_indptr = np.zeros(1, dtype=np.int64)
+        self.inv_docs = np.zeros(0, dtype=np.int32)
+        self.inv_tfs = np.zeros(0, dtype=np.int32)
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.id_to_doc)
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        """Index documents; existing IDs are replaced (upsert semantics)."""
+        ids, texts = list(ids), list(texts)
+        with self._lock:
+            self._delete([i for i in ids if i in self.id_to_doc])
+            self._add(ids, texts)
+
+    def _add(self, ids: List[str], texts: List[str]):
+        lengths = []
+        for doc_id, text in zip(ids, texts):
+            counts = Counter(tokenize(text))
+            term_ids = np.fromiter((self.vocab.setdefault(t, len(self.vocab)) for t in counts), dtype=np.int32, count=len(counts))
+            self._pending.append((term_ids, np.fromiter(counts.values(), dtype=np.int32, count=len(counts))))
+            self.id_to_doc[doc_id] = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            lengths.append(sum(counts.values()))
+
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self.doc_len = np.concatenate([self.doc_len, np.asarray(lengths, dtype=np.int32)])
+        self._dirty = True
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            self._delete(ids)
+
+    def _delete(self, ids: Iterable[str]):
+        docs = [doc for doc in (self.id_to_doc.pop(doc_id, None) for doc_id in ids) if doc is not None]
+        if docs:
+            # Copy-on-write: a search in flight keeps the mask it started with
+            alive = self.alive.copy()
+            alive[docs] = False
+            self.alive = alive
+            self._dirty = True
+
+    def _flush_pending(self):
+        if not self._pending:
+            return
+        terms = [t for t, _ in self._pending]
+        tfs = [f for _, f in self._pending]
+        offsets = np.cumsum([len(t) for t in terms], dtype=np.int64) + self.fwd_indptr[-1]
+        self.fwd_indptr = np.concatenate([self.fwd_indptr, offsets])
+        self.fwd_terms = np.concatenate([self.fwd_terms, *terms])
+        self.fwd_tfs = np.concatenate([self.fwd_tfs, *tfs])
+        self._pending = []
+
+    def _compact(self):
+        """Physically drop tombstoned documents and renumber the survivors."""
+        keep = np.flatnonzero(self.alive)
+        lengths = np.diff(self.fwd_indptr)[keep]
+        mask = np.repeat(self.alive, np.diff(self.fwd_indptr))
+
+        self.fwd_terms = self.fwd_terms[mask]
+        self.fwd_tfs = self.fwd_tfs[mask]
+        self.fwd_indptr = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        self.doc_len = self.doc_len[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.doc_ids = [self.doc_ids[i] for i in keep]
+        self.id_to_doc = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+    def _rebuild(self):
+        """Rebuild the inverted arrays from the forward index. Caller holds the lock."""
+        self._flush_pending()
+        if len(self.alive) and (~self.alive).sum() > 0.25 * len(self.alive):
+            self._compact()
+
+        doc_of_posting = np.repeat(np.arange(len(self.doc_ids), dtype=np.int32), np.diff(self.fwd_indptr))
+        order = np.argsort(self.fwd_terms, kind="stable")
+        counts = np.bincount(self.fwd_terms, minlength=len(self.vocab))
+        indptr = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        self.inv_indptr, self.inv_docs, self.inv_tfs = indptr, doc_of_posting[order], self.fwd_tfs[order]
+        self._dirty = False
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to top_k (doc_id, bm25_score) pairs with a positive score."""
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            # Writes replace these arrays rather than mutate them, so scoring can run unlocked
+            term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+            n_alive = len(self.id_to_doc)
+            doc_ids, alive, doc_len = self.doc_ids, self.alive, self.doc_len
+            inv_indptr, inv_docs, inv_tfs = self.inv_indptr, self.inv_docs, self.inv_tfs
+        if not term_ids or not n_alive:
+            return []
+
+        avgdl = max(float(doc_len[alive].mean()), 1.0)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+        scores = np.zeros(len(doc_len), dtype=np.float32)
+
+        for term in term_ids:
+            start, end = inv_indptr[term], inv_indptr[term + 1]
+            docs, tfs = inv_docs[start:end], inv_tfs[start:end]
+            live = alive[docs]
+            docs, tfs = docs[live], tfs[live]
+            if not len(docs):
+                continue
+            idf = math.log(1 + (n_alive - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(doc_ids[i], float(scores[i])) for i in candidates]
+
+    def is_keyword_query(self, query: str, max_terms: int = 3) -> bool:
+        """Short queries made only of indexed terms (a recipe or plant name) don't need embeddings."""
+        words = TOKEN_PATTERN.findall(query.lower())
+        terms = tokenize(query)
+        return 0 < len(words) <= max_terms and bool(terms) and all(t in self.vocab for t in terms)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, path: str):
+        with self._lock:
+            self._rebuild()
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                vocab=np.array(list(self.vocab), dtype=np.str_),
+                doc_ids=np.array(self.doc_ids, dtype=np.str_),
+                alive=self.alive,
+                doc_len=self.doc_len,
+                fwd_indptr=self.fwd_indptr,
+                fwd_terms=self.fwd_terms,
+                fwd_tfs=self.fwd_tfs,
+                inv_indptr=self.inv_indptr,
+                inv_docs=self.inv_docs,
+                inv_tfs=self.inv_tfs,
+            )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        index = cls(k1=k1, b=b)
+        with np.load(path, allow_pickle=False) as data:
+            index.vocab = {term: i for i, term in enumerate(data["vocab"].tolist())}
+            index.doc_ids = data["doc_ids"].tolist()
+            index.alive = data["alive"]
+            index.doc_len = data["doc_len"]
+            index.fwd_indptr = data["fwd_indptr"]
+            index.fwd_terms = data["fwd_terms"]
+            index.fwd_tfs = data["fwd_tfs"]
+            index.inv_indptr = data["inv_indptr"]
+            index.inv_docs = data["inv_docs"]
+            index.inv_tfs = data["inv_tfs"]
+        index.id_to_doc = {doc_id: i for i, doc_id in enumerate(index.doc_ids) if index.alive[i]}
+        logger.info(f"BM25Index: Loaded {len(index)} documents from {path}")
+        return index
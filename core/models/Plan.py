@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from core.models.Preference import Preference
+
+
+class Plan(BaseModel):
+    actions: List[str] = Field(
+        default_factory=list,
+        description="Actions to trigger, any of 'research', 'preferences', 'quit'"
+    )
+    reason: Optional[str] = Field(
+        None,
+        description="One short sentence explaining the chosen actions"
+    )
+    preference: Optional[Preference] = Field(
+        None,
+        description="The preference the user shared; set only when 'preferences' is in actions"
+    )
@@ -0,0 +1,111 @@
+import threading
+from typing import Iterable, List, Optional
+
+from langchain_text_splitters import TextSplitter
+
+from core.logger import logger
+
+MODEL_NAME = "en_core_web_sm"
+
+# Components each consumer actually needs; everything else is disabled per call.
+# tok2vec is kept automatically when one of the enabled components listens to it.
+PROFILES = {
+    # Sentence boundaries for chunking: the statistical senter (parser as fallback)
+    "chunking": ("senter",),
+    # Presidio: NER, plus the tagger/lemmatizer it uses for context words
+    "presidio": ("ner", "tagger", "attribute_ruler", "lemmatizer"),
+}
+
+
+class PipelineView:
+    """
+    One consumer's view of the shared pipeline: calls run with that consumer's
+    unused components disabled, everything else is delegated to the pipeline.
+    """
+    def __init__(self, nlp, disabled: List[str]):
+        self._nlp = nlp
+        self.disabled = disabled
+
+    def __call__(self, text: str, **kwargs):
+        return self._nlp(text, disable=self.disabled, **kwargs)
+
+    def pipe(self, texts: Iterable, **kwargs):
+        return self._nlp.pipe(texts, disable=self.disabled, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._nlp, name)
+
+
+class NLPRegistry:
+    """Process-wide owner of the spaCy pipeline; loads it once and hands out per-consumer views."""
+    def __init__(self, model_name: str = MODEL_NAME):
+        self.model_name = model_name
+        self._nlp = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def pipeline(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._nlp = self._load()
+                    self._loaded = True
+        return self._nlp
+
+    def _load(self):
+        try:
+            import spacy
+            nlp = spacy.load(self.model_name)
+        except (ImportError, OSError):
+            logger.warning("spaCy model not found, sentence splitting disabled")
+            return None
+        # senter ships disabled; enabling it is free since every view disables what it doesn't use
+        if "senter" in nlp.disabled:
+            nlp.enable_pipe("senter")
+        logger.info(f"NLPRegistry: Loaded shared pipeline {self.model_name} ({', '.join(nlp.pipe_names)})")
+        return nlp
+
+    def view(self, consumer: str) -> Optional[PipelineView]:
+        nlp = self.pipeline()
+        if nlp is None:
+            return None
+
+        wanted = {name for name in PROFILES[consumer] if name in nlp.pipe_names}
+        if consumer == "chunking" and not wanted and "parser" in nlp.pipe_names:
+            wanted = {"parser"}
+        if "tok2vec" in nlp.pipe_names:
+            listeners = getattr(nlp.get_pipe("tok2vec"), "listening_components", [])
+            if wanted & set(listeners):
+                wanted.add("tok2vec")
+        return PipelineView(nlp, [name for name in nlp.pipe_names if name not in wanted])
+
+
+_registry = NLPRegistry()
+
+
+def get_nlp_registry() -> NLPRegistry:
+    return _registry
+
+
+class SentenceTextSplitter(TextSplitter):
+    """
+    Same chunking as langchain's SpacyTextSplitter (sentences merged up to
+    chunk_size), but running on a shared pipeline view instead of loading a
+    pipeline per splitter instance.
+    """
+    def __init__(self, nlp: PipelineView, separator: str = "\n\n", strip_whitespace: bool = True, **kwargs):
+        super().__init__(strip_whitespace=strip_whitespace, **kwargs)
+        self._nlp = nlp
+        self._separator = separator
+        self._strip_whitespace = strip_whitespace
+
+    def _merge_doc(self, doc) -> List[str]:
+        splits = (s.text if self._strip_whitespace else s.text_with_ws for s in doc.sents)
+        return self._merge_splits(splits, self._separator)
+
+    def split_text(self, text: str) -> List[str]:
+        return self._merge_doc(self._nlp(text))
+
+    def split_texts(self, texts: List[str], batch_size: int = 32) -> List[List[str]]:
+        """Split many documents through one nlp.pipe pass."""
+        return [self._merge_doc(doc) for doc in self._nlp.pipe(texts, batch_size=batch_size)]
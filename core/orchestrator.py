@@ -1,87 +1,414 @@
+import time
 import asyncio
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional
 
 from core.logger import logger
 from core.conversation_memory import ConversationMemory
-from core.preference_detector import PreferenceAgent
-from core.RAGSystem import RAGSystem
-from core.researcher import ResearchAgent
-from core.synthesiser import SynthesizerAgent
-from core.controller_agent import ControllerAgent
-from core.guardrails import redact_pii, detect_pii
+from core.guardrails import StreamingRedactor, get_guardrail_engine
+from core.startup import StartupProfile, LazyComponent, WarmUp
+from core.action_graph import ActionGraph
+from otel_setup import speculative_retrievals, speculation_time_saved, response_ttft, response_latency
+
+# Per-action timeouts (seconds); a timed-out action contributes no context
+ACTION_TIMEOUTS = {
+    "preferences": 30.0,
+    "persist_preference": 30.0,
+    "research": 10.0,
+}
+
+
+# Component factories import their modules on first call, so importing the
+# orchestrator doesn't pull in chromadb, torch, spaCy or pydantic-ai.
+def _load_rag(ingest_workers: int = 0):
+    from core.RAGSystem import RAGSystem
+    return RAGSystem(ingest_workers=ingest_workers)
+
+
+def _load_controller():
+    from core.controller_agent import ControllerAgent
+    return ControllerAgent()
+
+
+def _load_planner():
+    from core.planner import PlannerAgent
+    return PlannerAgent()
+
+
+def _load_preference_agent():
+    from core.preference_detector import PreferenceAgent
+    return PreferenceAgent()
+
+
+def _load_synthesizer():
+    from core.synthesiser import SynthesizerAgent
+    return SynthesizerAgent()
 
 
 class Orchestrator:
-    def __init__(self):
-        self.memory = ConversationMemory()
-        self.rag = RAGSystem()
-        self.controller = ControllerAgent()
-        self.pref = PreferenceAgent()
-        self.research = ResearchAgent(self.rag)
-        self.synthesizer_agent = SynthesizerAgent()
+    def __init__(self, lazy: bool = False, warm_up: bool = False, speculative_retrieval: bool = False,
+                 intent_router: bool = False, planner: bool = False, response_cache: bool = False,
+                 router_shadow_rate: float = 0.05, ingest_workers: int = 0, memory_path: str = "data/memory.json",
+                 components: Optional[Dict[str, LazyComponent]] = None):
+        """
+        lazy=False loads every component up front, before the prompt appears.
+        lazy=True defers imports and model loads until first use; with warm_up=True
+        they are loaded on a background thread instead and `ready` flips once done.
+        Per-component load times are kept in `self.profile`.
+
+        speculative_retrieval=True starts knowledge retrieval while the controller
+        is still deciding; the result is used if it asks for research, dropped otherwise.
+
+        intent_router=True answers confident turns with the local embedding router
+        and only calls the LLM controller below its confidence threshold; a
+        `router_shadow_rate` fraction of local routes is checked against the LLM too.
+
+        planner=True replaces the controller + PreferenceAgent pair with one fused
+        PlannerAgent call that returns the actions and the extracted preference.
+
+        response_cache=True answers a question from the semantic response cache when a
+        near-identical one was answered from the same retrieved chunks.
+
+        ingest_workers > 0 ingests the seed notes with that many split and embed
+        workers (RAGSystem.bulk_ingest) instead of one note at a time.
+
+        memory_path is this conversation's ConversationMemory. `components` replaces
+        the named components with already-built ones (see `for_session`).
+        """
+        self.speculative_retrieval = speculative_retrieval
+        self.use_intent_router = intent_router
+        self.router_shadow_rate = router_shadow_rate
+        self.use_planner = planner
+        self.use_response_cache = response_cache
+        self.profile = StartupProfile()
+        self._components = {
+            name: LazyComponent(name, factory, self.profile)
+            for name, factory in (
+                ("memory", lambda: ConversationMemory(memory_path)),
+                ("guardrails", lambda: get_guardrail_engine().load()),
+                ("rag", lambda: _load_rag(ingest_workers)),
+                ("embedding_model", lambda: self.rag.model),
+                ("research", self._load_research_agent),
+                ("controller", _load_controller),
+                ("pref", _load_preference_agent),
+                ("synthesizer_agent", _load_synthesizer),
+                ("write_behind", self._load_write_behind),
+            )
+        }
+        if planner:
+            self._components["planner"] = LazyComponent("planner", _load_planner, self.profile)
+        if response_cache:
+            self._components["response_cache"] = LazyComponent("response_cache", self._load_response_cache, self.profile)
+        if intent_router:
+            self._components["router"] = LazyComponent("router", self._load_intent_router, self.profile)
+        self._shared = set(components or ())
+        self._components.update(components or {})
+        self.warm_up = None
+
+        if not lazy:
+            self.load()
+        elif warm_up:
+            self.start_warm_up()
+
+    def load(self, skip: Iterable[str] = ()):
+        """Load every component now, except those named in `skip`, and log the startup breakdown."""
+        for name, component in self._components.items():
+            if name not in skip:
+                component.get()
+        self.profile.log_report()
+
+    def start_warm_up(self, skip: Iterable[str] = ()) -> WarmUp:
+        """Load every component, except those named in `skip`, on a background thread."""
+        steps = [component.get for name, component in self._components.items() if name not in skip]
+        self.warm_up = WarmUp(steps, self.profile).start()
+        return self.warm_up
+
+    def for_session(self, memory_path: str) -> "Orchestrator":
+        """
+        An orchestrator for another conversation: its own ConversationMemory at
+        `memory_path`, every other component (models, RAG, agents, caches, the
+        write-behind queue) shared with this one.
+        """
+        shared = {name: component for name, component in self._components.items() if name != "memory"}
+        return Orchestrator(
+            lazy=True, speculative_retrieval=self.speculative_retrieval, intent_router=self.use_intent_router,
+            router_shadow_rate=self.router_shadow_rate, planner=self.use_planner,
+            response_cache=self.use_response_cache, memory_path=memory_path, components=shared,
+        )
+
+    def _load_research_agent(self):
+        from core.researcher import ResearchAgent
+        return ResearchAgent(self.rag)
+
+    def _load_write_behind(self):
+        from core.write_behind import WriteBehindQueue
+        return WriteBehindQueue(self.rag)
+
+    def _load_intent_router(self):
+        from core.intent_router import IntentRouter
+        return IntentRouter(self.rag.embed_queries, shadow_rate=self.router_shadow_rate)
+
+    def _load_response_cache(self):
+        from core.response_cache import SemanticResponseCache
+        cache = SemanticResponseCache()
+        cache.validate(self.rag.existing_knowledge_ids)
+        self.rag.add_knowledge_listener(cache.invalidate)
+        return cache
+
+    @property
+    def ready(self) -> bool:
+        """True once every component is loaded; requests before that load what they need inline."""
+        return all(c.loaded for c in self._components.values())
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        if self.warm_up:
+            self.warm_up.wait(timeout)
+        return self.ready
+
+    @property
+    def memory(self) -> ConversationMemory:
+        return self._components["memory"].get()
+
+    @property
+    def rag(self):
+        return self._components["rag"].get()
+
+    @property
+    def research(self):
+        return self._components["research"].get()
+
+    @property
+    def controller(self):
+        return self._components["controller"].get()
+
+    @property
+    def response_cache(self):
+        return self._components["response_cache"].get()
+
+    @property
+    def planner(self):
+        return self._components["planner"].get()
+
+    @property
+    def router(self):
+        return self._components["router"].get()
+
+    @property
+    def write_behind(self):
+        return self._components["write_behind"].get()
+
+    @property
+    def pref(self):
+        return self._components["pref"].get()
+
+    @property
+    def synthesizer_agent(self):
+        return self._components["synthesizer_agent"].get()
 
     
+    def _speculate(self, user_input: str) -> asyncio.Task:
+        """Start retrieval for the raw turn before the controller has decided anything."""
+        started = time.time()
+
+        async def retrieve():
+            results = await self.research.aretrieve_many([user_input])
+            return results[0], started, time.time()
+
+        return asyncio.create_task(retrieve(), name="speculative_retrieval")
+
+    async def _research(self, user_input: str, count: int, speculation: Optional[asyncio.Task] = None):
+        if speculation is None:
+            return await self.research.aretrieve_many([user_input] * count)
+
+        needed_at = time.time()
+        retrieved, started, finished = await speculation
+        speculative_retrievals.add(1, {"outcome": "used"})
+        speculation_time_saved.add((min(needed_at, finished) - started) * 1000)
+        return [retrieved] * count
+
+    async def _synthesize(self, user_input: str, collected_context: list[dict], stream: bool) -> AsyncIterator[str]:
+        """
+        Yield the guardrailed answer: redacted window by window when streaming,
+        otherwise as one piece. Only redacted text reaches the response cache.
+        """
+        query_embedding = None
+        if self.use_response_cache:
+            # Usually a query-embedding cache hit: retrieval or the router already embedded this input
+            query_embedding = (await self.rag.aembed_queries([user_input]))[0]
+            cached = self.response_cache.lookup(query_embedding, collected_context)
+            if cached:
+                logger.info(f"⚡ Answered from response cache (saved ~{cached.latency_ms:.0f} ms)")
+                yield cached.answer
+                return
+
+        start = time.time()
+        failed: list = []
+        answer = self._generate(user_input, collected_context, stream, failed)
+        # Output-side guardrail
+        parts = StreamingRedactor().redact(answer) if stream else self._redact_answer(answer)
+        shown = []
+        async for part in parts:
+            shown.append(part)
+            yield part
+
+        answer = "".join(shown)
+        if query_embedding is None or failed or not answer:
+            return
+        from core.synthesiser import FALLBACK_ANSWER
+        if answer != FALLBACK_ANSWER:
+            self.response_cache.put(query_embedding, collected_context, answer, (time.time() - start) * 1000)
+
+    async def _generate(self, user_input: str, collected_context: list[dict], stream: bool,
+                        failed: list) -> AsyncIterator[str]:
+        """Raw synthesizer output; appends to `failed` when a stream breaks off."""
+        if not stream:
+            yield await self.synthesizer_agent.run(user_input, collected_context)
+            return
+        try:
+            async for delta in self.synthesizer_agent.stream(user_input, collected_context):
+                yield delta
+        except Exception:
+            # Already logged by the synthesizer; keep what was shown, don't cache a partial answer
+            failed.append(True)
+
+    @staticmethod
+    async def _redact_answer(answer: AsyncIterator[str]) -> AsyncIterator[str]:
+        text = "".join([part async for part in answer])
+        yield (await get_guardrail_engine().ascan(text)).text
+
+    async def _persist_preference(self, preference) -> bool:
+        """
+        Journal the preference (one buffered append) and leave the vector DB write
+        and the fsync to the write-behind queue, so the turn doesn't wait for them.
+        The append runs off the event loop since it can wait on a save's lock.
+        """
+        pref_dict = preference.model_dump()
+        await asyncio.to_thread(self.memory.add_message, role="preference", content=pref_dict)
+        self.write_behind.submit(pref_dict, session=self.memory.path, memory=self.memory)
+        return True
+
+    def close(self):
+        """Commit queued writes, then close the journal. Shared components are left to their owner."""
+        memory_loaded = self._components["memory"].loaded
+        for name in ("router", "response_cache"):
+            component = self._components.get(name)
+            if component and component.loaded and name not in self._shared:
+                component.get().close()
+        if self._components["write_behind"].loaded:
+            if "write_behind" not in self._shared:
+                self.write_behind.close()
+            elif memory_loaded:
+                self.write_behind.wait(session=self.memory.path)
+        if memory_loaded:
+            self.memory.close()
+
     async def run(self):
         print(" Your Second Brain is online. Type 'quit' to exit.\n")
         while True:
             user_input_raw = input("You: ")
             if user_input_raw.strip().lower() == "quit":
                 print("Assistant: 👋 Goodbye!")
+                self.close()
                 return
             await self._run_once_cli(user_input_raw)
 
    
     async def _run_once_cli(self, user_input_raw: str):
-        response = await self.run_once(user_input_raw)
-        print(f"Assistant: {response['response']}")
+        print("Assistant: ", end="", flush=True)
+        async for delta in self.run_once_stream(user_input_raw):
+            print(delta, end="", flush=True)
+        print()
 
 
     async def run_once(self, user_input_raw: str):
-       
-        pii_entities = detect_pii(user_input_raw)
-        user_input = redact_pii(user_input_raw) if pii_entities else user_input_raw
+        parts = [part async for part in self._turn(user_input_raw, stream=False)]
+        return {
+            "response": "".join(parts)
+        }
 
-       
-        decision = await self.controller.decide_action(user_input)
-        actions = decision.get("actions", ["chat"])
+    def run_once_stream(self, user_input_raw: str) -> AsyncIterator[str]:
+        """Same turn as run_once, yielding the answer text incrementally as it is generated."""
+        return self._turn(user_input_raw, stream=True)
+
+    async def _turn(self, user_input_raw: str, stream: bool) -> AsyncIterator[str]:
+        turn_start = time.time()
+        first_output = True
 
-        collected_context: list[dict] = []
+        # One analyzer pass, or none for input without PII candidates (Presidio isn't even loaded then)
+        user_input = (await get_guardrail_engine().ascan(user_input_raw)).text
 
        
+        speculation = self._speculate(user_input) if self.speculative_retrieval else None
+        try:
+            controller = self.planner if self.use_planner else self.controller
+            if self.use_intent_router:
+                decision = await self.router.decide(user_input, controller)
+            else:
+                decision = await controller.decide_action(user_input)
+        except BaseException:
+            if speculation:
+                speculation.cancel()
+            raise
+        actions = decision.get("actions", ["chat"])
+
+        # Independent actions run concurrently; the preference write only waits for detection
+        graph = ActionGraph()
+        research_count = 0
         for action in actions:
             logger.info(f"[EVAL] Action: {action}")
 
             if action == "preferences":
-                preference = await self.pref.run(user_input)
-                if preference:
-                    pref_dict = preference.model_dump()
-                    collected_context.append(pref_dict)
+                if "preferences" not in graph:
+                    if decision.get("preference") is not None:
+                        # The fused planner already extracted it
+                        detect = lambda: asyncio.sleep(0, result=decision["preference"])
+                    else:
+                        detect = lambda: self.pref.run(user_input)
+                    graph.add("preferences", detect, timeout=ACTION_TIMEOUTS["preferences"])
+                    graph.add("persist_preference", self._persist_preference, deps=["preferences"],
+                              timeout=ACTION_TIMEOUTS["persist_preference"])
+            else:
+                # Research actions are batched into a single retrieval
+                research_count += 1
 
-                    # Persist memory + RAG (same as CLI)
-                    self.memory.add_message(role="preference", content=pref_dict)
-                    self.rag.add_to_vector_db(pref_dict)
-                    self.memory.save()
+        if research_count:
+            graph.add(
+                "research",
+                lambda: self._research(user_input, research_count, speculation),
+                timeout=ACTION_TIMEOUTS["research"],
+            )
+        elif speculation:
+            speculation.cancel()
+            speculative_retrievals.add(1, {"outcome": "wasted"})
 
-            else:
-                retrieved_context = self.research.retrieve(
-                    user_input
-                )
-                # logger.info(retrieved_context)
-                if retrieved_context:
-                    collected_context.append({
-                        "content": retrieved_context
-                    })
+        try:
+            graph.start()
+            preference, retrieved = await graph.results(["preferences", "research"])
+            pref_dict = preference.model_dump() if preference else None
 
-       
-        final_answer = await self.synthesizer_agent.run(
-            user_input,
-            collected_context
-        )
+            collected_context: list[dict] = []
+            research_results = iter(retrieved or [])
+            for action in actions:
+                if action == "preferences":
+                    if pref_dict and pref_dict not in collected_context:
+                        collected_context.append(pref_dict)
+                else:
+                    retrieved_context = next(research_results, None)
+                    if retrieved_context:
+                        collected_context.append({"content": retrieved_context})
 
-        return {
-            "response": final_answer
-        }
+            async for part in self._synthesize(user_input, collected_context, stream):
+                if first_output and stream:
+                    response_ttft.record((time.time() - turn_start) * 1000)
+                first_output = False
+                yield part
+            response_latency.record((time.time() - turn_start) * 1000, {"streamed": stream})
+            await graph.join()
+        finally:
+            graph.cancel()
 
 if __name__ == "__main__":
+    from otel_setup import setup_tracing
+
+    setup_tracing()
     asyncio.run(Orchestrator().run())
\ No newline at end of file
@@ -0,0 +1,70 @@
+import time
+from pydantic_ai import Agent
+from core.logger import logger
+from core.models.Plan import Plan
+from otel_setup import tracer, request_latency, RECORD_INPUT_TEXT
+
+
+class PlannerAgent:
+    """
+    Fused controller + preference detector: one structured call returns the
+    actions and, for preference turns, the extracted Preference. Drop-in for
+    ControllerAgent.decide_action; the decision carries the preference so the
+    orchestrator doesn't need a separate PreferenceAgent call.
+    """
+    def __init__(self):
+        self.agent = Agent(
+            model="gemini-2.5-flash",
+            output_type=Plan,
+            instructions="""
+            You are an AI Orchestrator that analyzes user input, decides which specialized agents to trigger,
+            and extracts any preference the user shares, all in one structured answer.
+
+            A single input may contain multiple intents, e.g.:
+            - "I like cats and eagles. Can you suggest a good documentary about them?"
+              → preferences + research
+
+            Available actions:
+            - "research": when the user asks a question to find, recall or wants to know or understand something
+            - "preferences": when the user shares a personal fact, habit, or like/dislike
+            - "quit": when the user wants to exit
+
+            When "preferences" is one of the actions, fill `preference`:
+            - title: short descriptive title, e.g. "Bollywood Dance Movies"
+            - content: what the user shared, e.g. "User enjoys Bollywood movies focused on dance."
+            - query_detected: true if the user ALSO asked a question
+            Otherwise leave `preference` null.
+
+            Rules:
+            - Return structured data only.
+            - Do NOT speak to the user or give recommendations.
+            """
+        )
+
+    async def plan(self, query: str) -> Plan:
+        result = await self.agent.run(query)
+        plan: Plan = result.output
+        if plan.preference and "preferences" not in plan.actions:
+            plan.actions.append("preferences")
+        if plan.preference:
+            logger.info(f"Preference detected: {plan.preference.model_dump()}")
+        return plan
+
+    async def decide_action(self, query: str):
+        with tracer.start_as_current_span("PlannerAgent.decide_action") as span:
+            span.set_attribute("input.length", len(query))
+            span.set_attribute("system.variant", "fused_planner")
+            start = time.time()
+            try:
+                plan = await self.plan(query)
+            except Exception:
+                span.add_event("plan_failed")
+                logger.exception("PlannerAgent failed")
+                return {"actions": ["chat"], "reason": "Default fallback"}
+            finally:
+                request_latency.record((time.time() - start) * 1000)
+
+            if RECORD_INPUT_TEXT:
+                span.set_attribute("input.text", query)
+            span.set_attribute("controller.actions", plan.actions)
+            return {"actions": plan.actions or ["chat"], "reason": plan.reason, "preference": plan.preference}
@@ -1,17 +1,27 @@
 from presidio_analyzer import AnalyzerEngine
-from presidio_analyzer.nlp_engine import NlpEngineProvider
+from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+from core.nlp import MODEL_NAME, get_nlp_registry
+
+MODELS = [
+    {
+        "lang_code": "en",
+        "model_name": MODEL_NAME,
+    }
+]
+
+
+class SharedSpacyNlpEngine(SpacyNlpEngine):
+    """Presidio NLP engine backed by the process-wide spaCy pipeline instead of its own copy."""
+    def load(self):
+        view = get_nlp_registry().view("presidio")
+        if view is None:
+            return super().load()
+        self.nlp = {"en": view}
+
 
 def create_presidio_analyzer():
-    nlp_engine = NlpEngineProvider(
-        nlp_configuration={
-            "nlp_engine_name": "spacy",
-            "models": [
-                {
-                    "lang_code": "en",
-                    "model_name": "en_core_web_sm",
-                }
-            ],
-        }
-    ).create_engine()
+    nlp_engine = SharedSpacyNlpEngine(models=MODELS)
+    nlp_engine.load()
 
     return AnalyzerEngine(nlp_engine=nlp_engine)
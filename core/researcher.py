@@ -35,3 +35,53 @@ class ResearchAgent:
             except Exception as e:
                 logger.exception("ResearchAgent failed during retrieval")
                 return []
+
+    def retrieve_many(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        """
+        Batched variant of `retrieve`: all queries share one embedding pass and one
+        vector store query. Returns one result list per input query.
+        """
+        valid = [q for q in queries if q and isinstance(q, str)]
+        if not valid:
+            return [[] for _ in queries]
+
+        with tracer.start_as_current_span("ResearchAgent.retrieve_many") as span:
+            span.set_attribute("batch.size", len(valid))
+            logger.info(f"ResearchAgent: Searching knowledge base for {len(valid)} queries...")
+
+            try:
+                batch = iter(self.rag.retrieve_knowledge_batch(queries=valid, top_k=top_k))
+                results = [next(batch) if q and isinstance(q, str) else [] for q in queries]
+                logger.info(f"Found {sum(len(r) for r in results)} relevant knowledge chunks")
+                return results
+
+            except Exception:
+                logger.exception("ResearchAgent failed during batched retrieval")
+                return [[] for _ in queries]
+
+    async def aretrieve(self, query: str, top_k: int = 5) -> list[dict]:
+        """`retrieve`, safe to await from the event loop."""
+        return (await self.aretrieve_many([query], top_k))[0]
+
+    async def aretrieve_many(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        """
+        `retrieve_many` for the event loop: queries are embedded through the shared
+        batcher and the vector query runs on the "rag" executor.
+        """
+        valid = [q for q in queries if q and isinstance(q, str)]
+        if not valid:
+            return [[] for _ in queries]
+
+        with tracer.start_as_current_span("ResearchAgent.retrieve_many") as span:
+            span.set_attribute("batch.size", len(valid))
+            logger.info(f"ResearchAgent: Searching knowledge base for {len(valid)} queries...")
+
+            try:
+                batch = iter(await self.rag.aretrieve_knowledge_batch(queries=valid, top_k=top_k))
+                results = [next(batch) if q and isinstance(q, str) else [] for q in queries]
+                logger.info(f"Found {sum(len(r) for r in results)} relevant knowledge chunks")
+                return results
+
+            except Exception:
+                logger.exception("ResearchAgent failed during batched retrieval")
+                return [[] for _ in queries]
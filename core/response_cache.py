@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.logger import logger
+from otel_setup import cache_hits, cache_misses, response_cache_saved_latency
+
+CACHE_NAME = "semantic_response"
+
+
+def context_fingerprint(context: List[Dict]) -> Tuple[str, List[str]]:
+    """
+    Hash of what the synthesizer sees besides the question: the retrieved chunk
+    IDs (order-insensitive) plus any other context items such as preferences.
+    Returns (key, chunk ids).
+    """
+    chunk_ids, other = set(), []
+    for item in context:
+        content = item.get("content")
+        if isinstance(content, list):
+            chunk_ids.update(c["id"] for c in content if isinstance(c, dict) and "id" in c)
+        else:
+            other.append(item)
+    chunk_ids = sorted(chunk_ids)
+    payload = json.dumps({"chunks": chunk_ids, "other": other}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest(), chunk_ids
+
+
+class CachedResponse:
+    __slots__ = ("entry_id", "embedding", "context_key", "chunk_ids", "answer", "latency_ms", "created", "last_used")
+
+    def __init__(self, entry_id: str, embedding: np.ndarray, context_key: str, chunk_ids: List[str], answer: str,
+                 latency_ms: float, created: float, last_used: float):
+        self.entry_id = entry_id
+        self.embedding = embedding
+        self.context_key = context_key
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.latency_ms = latency_ms
+        self.created = created
+        self.last_used = last_used
+
+    def to_record(self) -> Dict:
+        return {
+            "entry_id": self.entry_id,
+            "embedding": self.embedding.tolist(),
+            "context_key": self.context_key,
+            "chunk_ids": self.chunk_ids,
+            "answer": self.answer,
+            "latency_ms": self.latency_ms,
+            "created": self.created,
+            "last_used": self.last_used,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict) -> "CachedResponse":
+        return cls(
+            record["entry_id"], np.asarray(record["embedding"], dtype=np.float32), record["context_key"],
+            record["chunk_ids"], record["answer"], record["latency_ms"], record["created"], record["last_used"],
+        )
+
+
+class SemanticResponseCache:
+    """
+    Synthesizer answers keyed by (retrieved context fingerprint, query embedding):
+    a lookup hits when an entry with the same context has a query embedding
+    within `threshold` cosine similarity. Entries expire after `ttl` seconds,
+    the least recently used is evicted beyond `maxsize`, and entries that used
+    a knowledge chunk are dropped when that chunk is rewritten or deleted.
+
+    Persisted as an append-only JSONL log of {"put": entry} / {"drop": [ids]}
+    records, written by one background thread so the event loop never waits
+    on disk; the log is rewritten from the live entries once it grows to
+    twice their number.
+    """
+    def __init__(self, path: Optional[str] = "./data/response_cache.jsonl", threshold: float = 0.95,
+                 ttl: float = 24 * 3600, maxsize: int = 512):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._by_context: Dict[str, List[CachedResponse]] = {}
+        self._lock = threading.Lock()
+        self._attrs = {"cache": CACHE_NAME}
+        self._log_records = 0
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache-writer")
+
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._by_context.values())
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    # ------------------------------------------------------------------
+    # Lookup / insert
+    # ------------------------------------------------------------------
+    def lookup(self, query_embedding, context: List[Dict]) -> Optional[CachedResponse]:
+        key, _ = context_fingerprint(context)
+        now = time.time()
+        hit = None
+        with self._lock:
+            entries = [e for e in self._by_context.get(key, []) if now - e.created < self.ttl]
+            if entries:
+                sims = np.stack([e.embedding for e in entries]) @ self._unit(query_embedding)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    hit = entries[best]
+                    hit.last_used = now
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if hit:
+            cache_hits.add(1, self._attrs)
+            response_cache_saved_latency.record(hit.latency_ms)
+        else:
+            cache_misses.add(1, self._attrs)
+        return hit
+
+    def put(self, query_embedding, context: List[Dict], answer: str, latency_ms: float):
+        key, chunk_ids = context_fingerprint(context)
+        now = time.time()
+        entry = CachedResponse(uuid.uuid4().hex, self._unit(query_embedding), key, chunk_ids, answer,
+                               latency_ms, now, now)
+        with self._lock:
+            self._by_context.setdefault(key, []).append(entry)
+            dropped = self._evict(now)
+        # Serialized on the writer thread, off the caller's path
+        self._log([{"put": entry}] + ([{"drop": dropped}] if dropped else []))
+
+    def _evict(self, now: float) -> List[str]:
+        """Drop expired entries, then the least recently used beyond maxsize (caller holds the lock)."""
+        dropped = []
+        for key in list(self._by_context):
+            live = [e for e in self._by_context[key] if now - e.created < self.ttl]
+            dropped += [e.entry_id for e in self._by_context[key] if now - e.created >= self.ttl]
+            if live:
+                self._by_context[key] = live
+            else:
+                del self._by_context[key]
+
+        entries = [e for group in self._by_context.values() for e in group]
+        if len(entries) > self.maxsize:
+            cutoff = sorted(e.last_used for e in entries)[len(entries) - self.maxsize - 1]
+            for key in list(self._by_context):
+                kept = [e for e in self._by_context[key] if e.last_used > cutoff]
+                dropped += [e.entry_id for e in self._by_context[key] if e.last_used <= cutoff]
+                if kept:
+                    self._by_context[key] = kept
+                else:
+                    del self._by_context[key]
+        return dropped
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+    def invalidate(self, chunk_ids: Iterable[str]):
+        """Drop every answer built from any of these knowledge chunks (RAGSystem knowledge listener)."""
+        changed = set(chunk_ids)
+        if not changed or not self._by_context:
+            return
+        dropped = self._drop(lambda e: not changed.isdisjoint(e.chunk_ids))
+        if dropped:
+            logger.info(f"🧹 Dropped {dropped} cached responses after knowledge changes")
+
+    def validate(self, existing_ids: Callable[[List[str]], set]):
+        """Drop persisted answers whose chunks no longer exist (knowledge changed while we were down)."""
+        referenced = sorted({cid for group in self._by_context.values() for e in group for cid in e.chunk_ids})
+        alive = existing_ids(referenced)
+        self._drop(lambda e: any(cid not in alive for cid in e.chunk_ids))
+
+    def _drop(self, predicate: Callable[[CachedResponse], bool]) -> int:
+        dropped = []
+        with self._lock:
+            for key in list(self._by_context):
+                kept = []
+                for e in self._by_context[key]:
+                    if predicate(e):
+                        dropped.append(e.entry_id)
+                    else:
+                        kept.append(e)
+                if kept:
+                    self._by_context[key] = kept
+                else:
+                    del self._by_context[key]
+        if dropped:
+            self._log([{"drop": dropped}])
+        return len(dropped)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _log(self, records: List[Dict]):
+        if self.path:
+            self._writer.submit(self._append, records)
+
+    def _append(self, records: List[Dict]):
+        """Writer thread only, so appends and compactions never interleave."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for record in records:
+                    if "put" in record:
+                        record = {"put": record["put"].to_record()}
+                    f.write(json.dumps(record) + "\n")
+            self._log_records += len(records)
+            if self._log_records > 2 * len(self) + 64:
+                self._compact()
+        except OSError:
+            logger.exception(f"Failed to persist response cache to {self.path}")
+
+    def _compact(self):
+        """Rewrite the log as one put per live entry. Puts still queued behind this are replayed idempotently."""
+        with self._lock:
+            records = [{"put": e.to_record()} for group in self._by_context.values() for e in group]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_records = len(records)
+
+    def save(self):
+        """Block until every queued write is on disk, and compact the log."""
+        if self.path:
+            self._writer.submit(self._compact).result()
+
+    def close(self):
+        self.save()
+        self._writer.shutdown()
+
+    def _load(self, path: str):
+        entries: Dict[str, CachedResponse] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                self._log_records += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from a crash
+                if "put" in record:
+                    entry = CachedResponse.from_record(record["put"])
+                    entries[entry.entry_id] = entry
+                for entry_id in record.get("drop", []):
+                    entries.pop(entry_id, None)
+
+        for entry in entries.values():
+            self._by_context.setdefault(entry.context_key, []).append(entry)
+        dropped = self._evict(time.time())
+        if dropped:
+            self._log([{"drop": dropped}])
+        logger.info(f"SemanticResponseCache: Loaded {len(self)} cached responses from {path}")
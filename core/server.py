@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from core.logger import logger
+from core.orchestrator import Orchestrator
+from otel_setup import tracer, server_sessions, server_turns, server_turn_wait
+
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MAX_BODY = 64 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class Session:
+    __slots__ = ("id", "orchestrator", "lock", "last_used", "closed")
+
+    def __init__(self, session_id: str, orchestrator: Orchestrator):
+        self.id = session_id
+        self.orchestrator = orchestrator
+        self.lock = asyncio.Lock()  # one turn at a time per conversation
+        self.last_used = time.time()
+        self.closed = False  # set under `lock` before the orchestrator is closed
+
+
+class SessionServer:
+    """
+    Hosts many conversations in one process. Models, the RAG system, agents,
+    caches and the guardrail engine are loaded once and shared; each session
+    only owns a ConversationMemory under `memory_dir`. At most `max_concurrent`
+    turns run at once (a turn waiting longer than `queue_timeout` gets a 503),
+    and sessions idle for `idle_timeout` seconds, or least recently used beyond
+    `max_sessions`, are closed. A request not fully received within
+    `read_timeout` seconds gets a 408.
+
+    With lazy=True the shared stack is loaded off the event loop: on a warm-up
+    thread right away (warm_up=True) or when the first turn arrives.
+
+    Minimal HTTP/1.1 (one request per connection), over TCP and/or a unix socket:
+
+        POST   /sessions/<id>/messages   {"message": "..."}   -> {"response": "..."}
+               ?stream=1 streams the answer as chunked text/plain instead
+        DELETE /sessions/<id>
+        GET    /health
+    """
+    def __init__(self, memory_dir: str = "data/sessions", max_concurrent: int = 32, max_sessions: int = 1000,
+                 idle_timeout: float = 30 * 60, queue_timeout: float = 30.0, lazy: bool = False,
+                 warm_up: bool = False, read_timeout: float = 30.0, **orchestrator_options):
+        self.memory_dir = memory_dir
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.queue_timeout = queue_timeout
+        self.read_timeout = read_timeout
+        self.max_concurrent = max_concurrent
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # Sessions whose orchestrator is still closing; resolved once their journal is closed
+        self._closing: Dict[str, asyncio.Future] = {}
+        self._loading: Optional[asyncio.Future] = None
+        self.active_turns = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._servers = []
+        os.makedirs(memory_dir, exist_ok=True)
+
+        # The shared stack never opens a memory of its own; sessions bring theirs
+        self.shared = Orchestrator(lazy=True, **orchestrator_options)
+        if not lazy:
+            self.shared.load(skip=("memory",))
+        elif warm_up:
+            self.shared.start_warm_up(skip=("memory",))
+        self._loaded = not lazy
+
+    # ------------------------------------------------------------------
+    # Sessions
+    # ------------------------------------------------------------------
+    async def session(self, session_id: str) -> Session:
+        # Reopening a session that is still closing would put two memories on one journal
+        while session_id in self._closing:
+            await asyncio.shield(self._closing[session_id])
+        session = self.sessions.get(session_id)
+        if session is None:
+            orchestrator = self.shared.for_session(os.path.join(self.memory_dir, f"{session_id}.json"))
+            session = self.sessions[session_id] = Session(session_id, orchestrator)
+            server_sessions.add(1)
+            self._evict_lru()
+        self.sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        return session
+
+    async def close_session(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        closed = self._closing[session_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with session.lock:
+                # A turn queued on the lock must not run on the closed orchestrator
+                session.closed = True
+                # Waits for the session's queued writes, so it runs off the event loop
+                await asyncio.to_thread(session.orchestrator.close)
+        finally:
+            del self._closing[session_id]
+            closed.set_result(None)
+        server_sessions.add(-1)
+        logger.info(f"Closed session {session_id}")
+        return True
+
+    def _evict_lru(self):
+        excess = len(self.sessions) - self.max_sessions
+        for session_id, session in list(self.sessions.items()):
+            if excess <= 0:
+                break
+            if not session.lock.locked():
+                asyncio.create_task(self.close_session(session_id))
+                excess -= 1
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout))
+            cutoff = time.time() - self.idle_timeout
+            for session_id, session in list(self.sessions.items()):
+                if session.last_used < cutoff and not session.lock.locked():
+                    await self.close_session(session_id)
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+    async def serve(self, host: Optional[str] = "127.0.0.1", port: Optional[int] = 8080,
+                    unix_socket: Optional[str] = None):
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        if port is not None:
+            self._servers.append(await asyncio.start_server(self._handle, host, port))
+            logger.info(f"🌐 Serving on http://{host}:{port}")
+        if unix_socket:
+            self._servers.append(await asyncio.start_unix_server(self._handle, unix_socket))
+            logger.info(f"🌐 Serving on unix socket {unix_socket}")
+        reaper = asyncio.create_task(self._reap_idle(), name="server.reap_idle")
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self._servers))
+        finally:
+            reaper.cancel()
+            await self.shutdown()
+
+    async def shutdown(self):
+        for server in self._servers:
+            server.close()
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        await asyncio.to_thread(self.shared.close)
+        logger.info("SessionServer: Shut down cleanly")
+
+    async def _ensure_loaded(self):
+        """Lazy mode: wait for the shared stack without loading models on the event loop."""
+        if self._loaded:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self._load_shared))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None  # let the next turn try again
+            raise
+        self._loaded = True
+
+    def _load_shared(self):
+        if self.shared.warm_up:
+            self.shared.warm_up.wait()
+        # Picks up anything the warm-up didn't get to (or failed on), still off the loop
+        self.shared.load(skip=("memory",))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, target, body = await asyncio.wait_for(self._read_request(reader), self.read_timeout)
+            except asyncio.TimeoutError:
+                return await self._send_json(writer, 408, {"error": "request not received in time"})
+            await self._route(method, urlsplit(target), body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            await self._send_json(writer, 400, {"error": "malformed request"})
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("Unhandled server error")
+            with contextlib.suppress(ConnectionError):
+                await self._send_json(writer, 500, {"error": "internal error"})
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        return method.upper(), target, await reader.readexactly(length) if length else b""
+
+    async def _route(self, method: str, url, body: bytes, writer: asyncio.StreamWriter):
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            return await self._send_json(writer, 200, {
+                "sessions": len(self.sessions),
+                "active_turns": self.active_turns,
+            })
+        if len(parts) < 2 or parts[0] != "sessions" or not SESSION_ID.match(parts[1]):
+            return await self._send_json(writer, 404, {"error": "not found"})
+
+        session_id = parts[1]
+        if parts[2:] == [] and method == "DELETE":
+            closed = await self.close_session(session_id)
+            return await self._send_json(writer, 200 if closed else 404, {"closed": closed})
+        if parts[2:] != ["messages"]:
+            return await self._send_json(writer, 404, {"error": "not found"})
+        if method != "POST":
+            return await self._send_json(writer, 405, {"error": "use POST"})
+
+        payload = json.loads(body or b"{}")
+        message = payload.get("message") if isinstance(payload, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            return await self._send_json(writer, 400, {"error": "'message' must be a non-empty string"})
+        stream = parse_qs(url.query).get("stream", ["0"])[0] not in ("0", "false", "")
+        await self._turn(session_id, message, stream, writer)
+
+    async def _turn(self, session_id: str, message: str, stream: bool, writer: asyncio.StreamWriter):
+        if message.strip().lower() == "quit":
+            await self.close_session(session_id)
+            return await self._send_json(writer, 200, {"response": "👋 Goodbye!"})
+
+        queued = time.time()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            server_turns.add(1, {"status": "rejected"})
+            return await self._send_json(writer, 503, {"error": "server busy, retry later"})
+        server_turn_wait.record((time.time() - queued) * 1000)
+
+        self.active_turns += 1
+        status = "ok"
+        session = None
+        try:
+            await self._ensure_loaded()
+            session = await self._lock_session(session_id)
+            try:
+                # Opening the session's journal reads its tail from disk
+                await asyncio.to_thread(lambda: session.orchestrator.memory)
+                with tracer.start_as_current_span("server.turn") as span:
+                    span.set_attribute("session.id", session_id)
+                    span.set_attribute("turn.streamed", stream)
+                    if stream:
+                        await self._stream_turn(session.orchestrator, message, writer)
+                    else:
+                        result = await session.orchestrator.run_once(message)
+                        await self._send_json(writer, 200, result)
+            finally:
+                session.lock.release()
+        except ConnectionError:
+            status = "disconnected"
+        except Exception:
+            status = "error"
+            logger.exception(f"Turn failed for session {session_id}")
+            if not stream:
+                await self._send_json(writer, 500, {"error": "turn failed"})
+        finally:
+            if session:
+                session.last_used = time.time()
+            self.active_turns -= 1
+            self._slots.release()
+            server_turns.add(1, {"status": status})
+
+    async def _lock_session(self, session_id: str) -> Session:
+        """The session for `session_id` with its lock held, reopened if it closed while we waited."""
+        while True:
+            session = await self.session(session_id)
+            await session.lock.acquire()
+            if not session.closed:
+                return session
+            session.lock.release()
+
+    async def _stream_turn(self, orchestrator: Orchestrator, message: str, writer: asyncio.StreamWriter):
+        writer.write(self._head(200, "text/plain; charset=utf-8", chunked=True))
+        async for delta in orchestrator.run_once_stream(message):
+            data = delta.encode("utf-8")
+            if data:
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # ------------------------------------------------------------------
+    # HTTP helpers
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _head(status: int, content_type: str, length: Optional[int] = None, chunked: bool = False) -> bytes:
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        else:
+            lines.append(f"Content-Length: {length or 0}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(self._head(status, "application/json", len(body)) + body)
+        await writer.drain()
@@ -0,0 +1,91 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from core.logger import logger
+from otel_setup import tracer, agent_latency
+
+
+class StartupProfile:
+    """Per-component load times (ms), recorded as each component is first built."""
+    def __init__(self):
+        self.started = time.time()
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, component: str):
+        start = time.time()
+        with tracer.start_as_current_span(f"startup.{component}"):
+            yield
+        duration = (time.time() - start) * 1000
+        with self._lock:
+            self.timings[component] = duration
+        agent_latency.record(duration, {"component": component, "stage": "load"})
+        logger.info(f"⏱️ Loaded {component} in {duration:.0f} ms")
+
+    def report(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.timings)
+
+    def log_report(self):
+        timings = self.report()
+        lines = [f"  {name:<20}{ms:>8.0f} ms" for name, ms in sorted(timings.items(), key=lambda kv: -kv[1])]
+        logger.info("Startup breakdown:\n" + "\n".join(lines) + f"\n  {'total':<20}{sum(timings.values()):>8.0f} ms")
+
+
+class LazyComponent:
+    """Builds a component on first use (once, even under concurrent access) and times the load."""
+    def __init__(self, name: str, factory: Callable[[], Any], profile: StartupProfile):
+        self.name = name
+        self.factory = factory
+        self.profile = profile
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                with self.profile.timed(self.name):
+                    self._value = self.factory()
+                self._loaded = True
+        return self._value
+
+
+class WarmUp:
+    """
+    Loads components on a background thread so the first request doesn't pay
+    for them. `ready` is set once every step finished (or failed).
+    """
+    def __init__(self, steps: Iterable[Callable[[], Any]], profile: Optional[StartupProfile] = None):
+        self.steps = list(steps)
+        self.profile = profile
+        self.ready = threading.Event()
+        self.errors: list[Exception] = []
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+
+    def start(self) -> "WarmUp":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        for step in self.steps:
+            try:
+                step()
+            except Exception as e:
+                logger.exception("Warm-up step failed")
+                self.errors.append(e)
+        self.ready.set()
+        if self.profile:
+            self.profile.log_report()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
@@ -1,15 +1,23 @@
+import time
+from typing import AsyncIterator, Optional
+
 from core.logger import logger
 from pydantic_ai import Agent
 from opentelemetry import trace
+from otel_setup import agent_latency, synthesis_ttft
+from core.context_packer import ContextPacker
 
 tracer = trace.get_tracer(__name__)
 
+FALLBACK_ANSWER = "Sorry, I couldn't generate a detailed answer at this time."
+
 
 class SynthesizerAgent:
     """
     Synthesizes user queries and retrieved context into rich, detailed, actionable answers.
     """
-    def __init__(self):
+    def __init__(self, packer: Optional[ContextPacker] = None):
+        self.packer = packer or ContextPacker()
         self.agent = Agent(
             model="google-gla:gemini-2.5-pro",
             instructions="""
@@ -32,15 +40,14 @@ Give clear, readable sentences only.
             """
         )
 
-    async def run(self, query: str, context_chunks: list[dict]):
-        with tracer.start_as_current_span("SynthesizerAgent.run"):
-            # Combine context into a single text block for the prompt
-            context_text = "\n\n".join(
-                f"Source {i+1}: {chunk.get('metadata', {}).get('source', 'Unknown')}\n{chunk['content']}"
-                for i, chunk in enumerate(context_chunks)
-            )
+    def build_prompt(self, query: str, context_chunks: list[dict]) -> str:
+        # Flatten, deduplicate and budget the context, then combine it into a single text block
+        context_text = "\n\n".join(
+            f"Source {i+1}: {chunk.get('metadata', {}).get('source', 'Unknown')}\n{chunk['content']}"
+            for i, chunk in enumerate(self.packer.pack(context_chunks))
+        )
 
-            prompt = f"""
+        return f"""
             Based on the following context, provide a detailed, structured answer to the user's question.
 
             CONTEXT:
@@ -52,6 +59,10 @@ Give clear, readable sentences only.
             answer when user asks a query, if the user only tells something acknowledge it with grace.
             """
 
+    async def run(self, query: str, context_chunks: list[dict]):
+        with tracer.start_as_current_span("SynthesizerAgent.run"):
+            prompt = self.build_prompt(query, context_chunks)
+
             try:
                 result = await self.agent.run(prompt)
                 answer = result.output.strip()
@@ -59,4 +70,36 @@ Give clear, readable sentences only.
                 return answer
             except Exception as e:
                 logger.exception(f"SynthesizerAgent failed: {str(e)}")
-                return "Sorry, I couldn't generate a detailed answer at this time."
+                return FALLBACK_ANSWER
+
+    async def stream(self, query: str, context_chunks: list[dict]) -> AsyncIterator[str]:
+        """
+        Yield the answer as text deltas while the model generates it. A failure
+        before the first delta yields the fallback answer; a failure mid-answer
+        is raised, since part of the answer has already been shown.
+        """
+        span = tracer.start_span("SynthesizerAgent.stream")
+        start = time.time()
+        emitted = False
+        try:
+            async with self.agent.run_stream(self.build_prompt(query, context_chunks)) as result:
+                async for delta in result.stream_text(delta=True):
+                    if not emitted:
+                        delta = delta.lstrip()
+                    if not delta:
+                        continue
+                    if not emitted:
+                        emitted = True
+                        ttft = (time.time() - start) * 1000
+                        synthesis_ttft.record(ttft)
+                        span.set_attribute("ttft.ms", ttft)
+                    yield delta
+            logger.info("SynthesizerAgent: Streamed response successfully")
+        except Exception as e:
+            logger.exception(f"SynthesizerAgent stream failed: {str(e)}")
+            if emitted:
+                raise
+            yield FALLBACK_ANSWER
+        finally:
+            agent_latency.record((time.time() - start) * 1000, {"component": "synthesizer", "stage": "stream"})
+            span.end()
@@ -6,32 +6,40 @@ Common utilities for RAG search methods
 import os
 import glob
 
-def read_notes():
-    """Read all documents from directory"""
-    docs = []
-    doc_paths = []
-    
-    
+def iter_note_paths():
+    """Yield note file paths without reading them"""
     possible_paths = [
         "notes/**/*.txt",                  
         "./notes/**/*.txt"                
     ]
     
-    files = []
     for pattern in possible_paths:
-        files = glob.glob(pattern, recursive=True)
-        if files:
-            break
-    
-    for file_path in files:
+        files = glob.iglob(pattern, recursive=True)
+        first = next(files, None)
+        if first is not None:
+            yield first
+            yield from files
+            return
+
+def iter_notes():
+    """Stream (content, path) pairs one file at a time"""
+    for file_path in iter_note_paths():
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read().strip()
                 if content:  # Only add non-empty files
-                    docs.append(content)
-                    doc_paths.append(file_path)
+                    yield content, file_path
         except Exception as e:
             print(f"Warning: Could not read {file_path}: {e}")
+
+def read_notes():
+    """Read all documents from directory"""
+    docs = []
+    doc_paths = []
+    
+    for content, file_path in iter_notes():
+        docs.append(content)
+        doc_paths.append(file_path)
     
     return docs, doc_paths
 
@@ -0,0 +1,456 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.logger import logger
+
+
+class VectorStore(ABC):
+    """
+    Minimal collection interface used by RAGSystem. Method names, keyword
+    arguments and result shapes follow chromadb's Collection API so the Chroma
+    implementation is a thin pass-through.
+    """
+    name: str
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[str], embeddings: List, metadatas: List[Dict]): ...
+
+    @abstractmethod
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List, metadatas: List[Dict]): ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None): ...
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> Dict: ...
+
+    @abstractmethod
+    def query(self, query_embeddings: List, n_results: int = 10, where: Optional[Dict] = None) -> Dict:
+        """Returns {"ids", "documents", "metadatas", "distances"}, one list per query; distance is cosine distance."""
+
+    def persist(self):
+        """Flush in-memory state to disk. No-op for stores that write through."""
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self.collection.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=list(include))
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+
+class FaissVectorStore(VectorStore):
+    """
+    FAISS index plus an SQLite sidecar holding ids, documents, metadata and the
+    full-precision vectors.
+
+    - index_type: "flat" (exact), "ivf" (inverted lists, tune with nprobe) or
+      "hnsw" (graph, tune with ef_search)
+    - Vectors are L2-normalised and searched by inner product, so distances are
+      cosine distances just like the Chroma collections ("hnsw:space": "cosine").
+    - The index file is opened memory-mapped and only loaded into RAM on the
+      first write. Deletes are tombstoned in the sidecar (HNSW cannot remove)
+      and dropped on rebuild().
+    - Trainable indexes stay untrained until `train_size` vectors exist; until
+      then queries are answered exactly from the sidecar vectors.
+    - compression: "none" (float32), "float16", "int8" (scalar quantizers) or
+      "pq" (product quantization, `pq_m` sub-vectors of `pq_nbits` bits). Queries
+      stay float32 and are scored against the codes (asymmetric distance). With
+      rescore=N the top k*N candidates are re-ranked against the full-precision
+      vectors in the sidecar.
+    """
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        index_type: str = "flat",
+        nlist: int = 256,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        train_size: Optional[int] = None,
+        compression: str = "none",
+        pq_m: int = 16,
+        pq_nbits: int = 8,
+        rescore: int = 0,
+    ):
+        import faiss  # optional backend, imported only when selected
+
+        self.faiss = faiss
+        self.name = name
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.compression = compression
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.rescore = rescore
+        # faiss wants ~39 training points per centroid (IVF lists, PQ codewords)
+        self.train_size = train_size or max(
+            nlist * 39 if index_type == "ivf" else 1,
+            2 ** pq_nbits * 39 if compression == "pq" else 1,
+            1024 if compression == "int8" else 1,  # enough to estimate per-dimension ranges
+        )
+
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, f"{name}.faiss")
+        self.db = sqlite3.connect(os.path.join(directory, f"{name}.sqlite"), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                rowid INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                document TEXT,
+                metadata TEXT,
+                embedding BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._lock = threading.RLock()
+        self._mmapped = False
+        self._dirty = False
+        self.index = None
+        self.dim = self._meta("dim", int)
+        self._load_index()
+
+    # ------------------------------------------------------------------
+    # Index lifecycle
+    # ------------------------------------------------------------------
+    def _meta(self, key: str, cast=str):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return cast(row[0]) if row else None
+
+    def _set_meta(self, key: str, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _last_rowid(self) -> int:
+        """Highest rowid ever assigned; never reused so tombstoned HNSW entries can't alias new rows."""
+        row = self.db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'vectors'").fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self):
+        self._set_meta("version", (self._meta("version", int) or 0) + 1)
+
+    def _new_index(self):
+        faiss, d, ip = self.faiss, self.dim, self.faiss.METRIC_INNER_PRODUCT
+        sq_types = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+        if self.compression not in ("none", "pq", *sq_types):
+            raise ValueError(f"Unknown compression: {self.compression}")
+
+        if self.index_type == "flat":
+            if self.compression == "pq":
+                base = faiss.IndexPQ(d, self.pq_m, self.pq_nbits, ip)
+            elif self.compression in sq_types:
+                base = faiss.IndexScalarQuantizer(d, sq_types[self.compression], ip)
+            else:
+                base = faiss.IndexFlatIP(d)
+        elif self.index_type == "ivf":
+            # IVF stores external ids natively; wrapping it in an IDMap breaks remove_ids
+            self._quantizer = faiss.IndexFlatIP(d)
+            if self.compression == "pq":
+                return faiss.IndexIVFPQ(self._quantizer, d, self.nlist, self.pq_m, self.pq_nbits, ip)
+            if self.compression in sq_types:
+                return faiss.IndexIVFScalarQuantizer(self._quantizer, d, self.nlist, sq_types[self.compression], ip)
+            return faiss.IndexIVFFlat(self._quantizer, d, self.nlist, ip)
+        elif self.index_type == "hnsw":
+            if self.compression == "pq":
+                base = faiss.IndexHNSWPQ(d, self.pq_m, self.hnsw_m, self.pq_nbits, ip)
+            elif self.compression in sq_types:
+                base = faiss.IndexHNSWSQ(d, sq_types[self.compression], self.hnsw_m, ip)
+            else:
+                base = faiss.IndexHNSWFlat(d, self.hnsw_m, ip)
+        else:
+            raise ValueError(f"Unknown FAISS index type: {self.index_type}")
+        return faiss.IndexIDMap2(base)
+
+    def index_nbytes(self) -> int:
+        """Serialized size of the vector index (codes plus structure), excluding the sidecar."""
+        if self.index is None:
+            return 0
+        return len(self.faiss.serialize_index(self.index))
+
+    def _load_index(self):
+        if self.dim is None:
+            return
+        if os.path.exists(self.index_path) and self._meta("indexed_version") == self._meta("version"):
+            try:
+                self.index = self.faiss.read_index(self.index_path, self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY)
+                self._mmapped = True
+            except RuntimeError:
+                self.index = self.faiss.read_index(self.index_path)
+            self._configure_search()
+            logger.info(f"FaissVectorStore[{self.name}]: Loaded {self.index.ntotal} vectors")
+            return
+        # Index missing or behind the sidecar (crash before persist): rebuild from stored vectors
+        self.rebuild()
+
+    def _writable_index(self):
+        if self._mmapped:
+            self.index = self.faiss.read_index(self.index_path)
+            self._mmapped = False
+            self._configure_search()
+        return self.index
+
+    def _configure_search(self):
+        base = self.index
+        if isinstance(base, (self.faiss.IndexIDMap, self.faiss.IndexIDMap2)):
+            base = self.faiss.downcast_index(base.index)
+        if hasattr(base, "nprobe"):
+            base.nprobe = self.nprobe
+        if hasattr(base, "hnsw"):
+            base.hnsw.efSearch = self.ef_search
+
+    def _train_if_ready(self) -> bool:
+        """Train a trainable index once enough vectors exist, then index everything stored so far."""
+        if self.index.is_trained:
+            return True
+        if self.db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0] < self.train_size:
+            return False
+        rowids, vectors = self._stored_vectors()
+        self.index.train(vectors)
+        self.index.add_with_ids(vectors, rowids)
+        logger.info(f"FaissVectorStore[{self.name}]: Trained {self.index_type}/{self.compression} index on {len(rowids)} vectors")
+        return True
+
+    def rebuild(self):
+        """Recreate the index from the sidecar vectors, dropping tombstones."""
+        with self._lock:
+            if self.dim is None:
+                return
+            self.index = self._new_index()
+            self._mmapped = False
+            self._configure_search()
+            if self._train_if_ready() and self.index.ntotal == 0:
+                rowids, vectors = self._stored_vectors()
+                if len(rowids):
+                    self.index.add_with_ids(vectors, rowids)
+            self._dirty = True
+            self.persist()
+
+    def persist(self):
+        with self._lock:
+            if self.index is None or not self._dirty:
+                return
+            tmp_path = f"{self.index_path}.tmp"
+            self.faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self._set_meta("indexed_version", self._meta("version"))
+            self.db.commit()
+            self._dirty = False
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, ids, documents, embeddings, metadatas):
+        with self._lock:
+            existing = self._rowids_for(ids)
+            if existing:
+                raise ValueError(f"IDs already exist in {self.name}: {list(existing)[:5]}")
+            self._insert(ids, documents, embeddings, metadatas)
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        with self._lock:
+            self.delete(ids=ids)
+            self._insert(ids, documents, embeddings, metadatas)
+
+    def _insert(self, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._set_meta("dim", self.dim)
+            self.index = self._new_index()
+            self._configure_search()
+
+        start = self._last_rowid() + 1
+        rowids = np.arange(start, start + len(ids), dtype=np.int64)
+        self.db.executemany(
+            "INSERT INTO vectors (rowid, id, document, metadata, embedding) VALUES (?, ?, ?, ?, ?)",
+            [
+                (int(r), i, doc, json.dumps(meta or {}), vec.tobytes())
+                for r, i, doc, meta, vec in zip(rowids, ids, documents or [None] * len(ids), metadatas or [None] * len(ids), vectors)
+            ],
+        )
+        self._bump_version()
+        self.db.commit()
+
+        index = self._writable_index()
+        if index.is_trained:
+            index.add_with_ids(vectors, rowids)
+        else:
+            self._train_if_ready()
+        self._dirty = True
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            clause, params = self._where_sql(ids, where)
+            rowids = [r for (r,) in self.db.execute(f"SELECT rowid FROM vectors {clause}", params)]
+            if not rowids:
+                return
+            self.db.executemany("DELETE FROM vectors WHERE rowid = ?", [(r,) for r in rowids])
+            self._bump_version()
+            self.db.commit()
+            if self.index is None:
+                return
+            if self.index_type != "hnsw":
+                self._writable_index().remove_ids(np.asarray(rowids, dtype=np.int64))
+            elif self.index.ntotal > 2 * self.count() + 1024:
+                self.rebuild()
+            self._dirty = True
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        clause, params = self._where_sql(ids, where)
+        sql = f"SELECT id, document, metadata, embedding FROM vectors {clause} ORDER BY rowid"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params = [*params, -1 if limit is None else limit, offset or 0]
+        rows = self.db.execute(sql, params).fetchall()
+        return self._rows_to_result(rows, include)
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        queries = self._normalize(query_embeddings)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            exact = self.index is None or not self.index.is_trained
+            for q in queries:
+                hits = self._exact_search(q, n_results, where) if exact else self._index_search(q, n_results, where)
+                result["ids"].append([h[0] for h in hits])
+                result["documents"].append([h[1] for h in hits])
+                result["metadatas"].append([h[2] for h in hits])
+                result["distances"].append([1 - h[3] for h in hits])
+        return result
+
+    def _index_search(self, q: np.ndarray, k: int, where: Optional[Dict]) -> List:
+        """Over-fetch to make room for tombstones and filters, widening until k survive."""
+        fetch = k * max(self.rescore, 4 if where else 2)
+        while True:
+            scores, rowids = self.index.search(q[None, :], min(fetch, max(self.index.ntotal, 1)))
+            scores, rowids = scores[0], rowids[0]
+            if self.rescore:
+                scores, rowids = self._rescore(q, rowids)
+            hits = self._resolve(rowids, scores, where)
+            if len(hits) >= k or fetch >= self.index.ntotal:
+                return hits[:k]
+            fetch *= 4
+
+    def _rescore(self, q: np.ndarray, rowids: np.ndarray):
+        """Re-rank compressed-index candidates by exact inner product with the stored float32 vectors."""
+        wanted = [int(r) for r in rowids if r >= 0]
+        if not wanted:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        rows = self.db.execute(
+            f"SELECT rowid, embedding FROM vectors WHERE rowid IN ({','.join('?' * len(wanted))})", wanted
+        ).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        found = np.fromiter((r for r, _ in rows), dtype=np.int64, count=len(rows))
+        scores = np.frombuffer(b"".join(e for _, e in rows), dtype=np.float32).reshape(len(rows), -1) @ q
+        order = np.argsort(-scores)
+        return scores[order], found[order]
+
+    def _exact_search(self, q: np.ndarray, k: int, where: Optional[Dict]) -> List:
+        clause, params = self._where_sql(None, where)
+        rows = self.db.execute(f"SELECT rowid, embedding FROM vectors {clause}", params).fetchall()
+        if not rows:
+            return []
+        rowids = np.fromiter((r for r, _ in rows), dtype=np.int64, count=len(rows))
+        scores = np.frombuffer(b"".join(e for _, e in rows), dtype=np.float32).reshape(len(rows), -1) @ q
+        order = np.argsort(-scores)[:k]
+        return self._resolve(rowids[order], scores[order], None)
+
+    def _resolve(self, rowids: np.ndarray, scores: np.ndarray, where: Optional[Dict]) -> List:
+        wanted = [int(r) for r in rowids if r >= 0]
+        if not wanted:
+            return []
+        clause, params = self._where_sql(None, where)
+        clause = f"{clause} AND" if clause else "WHERE"
+        placeholders = ",".join("?" * len(wanted))
+        rows = {
+            r: (i, doc, json.loads(meta))
+            for r, i, doc, meta in self.db.execute(
+                f"SELECT rowid, id, document, metadata FROM vectors {clause} rowid IN ({placeholders})",
+                [*params, *wanted],
+            )
+        }
+        return [(*rows[int(r)], float(s)) for r, s in zip(rowids, scores) if int(r) in rows]
+
+    @staticmethod
+    def _where_sql(ids: Optional[List[str]], where: Optional[Dict]):
+        conditions, params = [], []
+        if ids is not None:
+            conditions.append(f"id IN ({','.join('?' * len(ids))})" if ids else "0")
+            params.extend(ids)
+        for key, value in (where or {}).items():
+            if isinstance(value, dict) and "$eq" in value:
+                value = value["$eq"]
+            conditions.append("json_extract(metadata, ?) = ?")
+            params.extend([f"$.{key}", value])
+        return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def _rowids_for(self, ids: List[str]) -> Dict[str, int]:
+        clause, params = self._where_sql(ids, None)
+        return {i: r for r, i in self.db.execute(f"SELECT rowid, id FROM vectors {clause}", params)}
+
+    def _stored_vectors(self):
+        rows = self.db.execute("SELECT rowid, embedding FROM vectors ORDER BY rowid").fetchall()
+        rowids = np.fromiter((r for r, _ in rows), dtype=np.int64, count=len(rows))
+        vectors = np.frombuffer(b"".join(e for _, e in rows), dtype=np.float32).reshape(len(rows), self.dim)
+        return rowids, vectors
+
+    @staticmethod
+    def _rows_to_result(rows, include) -> Dict:
+        result = {"ids": [r[0] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [r[1] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(r[2]) for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.frombuffer(r[3], dtype=np.float32) for r in rows]
+        return result
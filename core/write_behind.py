@@ -0,0 +1,181 @@
+import json
+import time
+import atexit
+import threading
+from typing import Dict, List, Optional
+
+from core.logger import logger
+from otel_setup import write_behind_batch_size, write_behind_lag
+
+
+class PendingWrite:
+    __slots__ = ("ticket", "session", "context", "memory", "queued", "attempts")
+
+    def __init__(self, ticket: int, session: str, context: Dict, memory, queued: float):
+        self.ticket = ticket
+        self.session = session
+        self.context = context
+        self.memory = memory
+        self.queued = queued
+        self.attempts = 0
+
+
+class WriteBehindQueue:
+    """
+    Takes preference persistence off the request path. `submit` only enqueues;
+    a background thread waits up to `max_delay` seconds (or `max_batch` writes)
+    for more, drops duplicate contexts, embeds the whole batch in one pass via
+    RAGSystem.add_many_to_vector_db and saves each ConversationMemory it touched once.
+
+    A batch whose vector DB write fails is retried up to `max_attempts` times
+    with exponential backoff (`retry_backoff` seconds, doubling), in order;
+    after that its writes are kept in `failed` instead of being dropped silently.
+
+    Read-your-writes: `pending(session)` returns what a session queued that isn't
+    in the vector DB (still queued, or failed), and `wait(session)` blocks until
+    it is settled, returning False if any of it failed. `flush` drains the
+    queue; `close` flushes and stops the thread (also registered at exit).
+    """
+    def __init__(self, rag, max_batch: int = 64, max_delay: float = 0.2, max_attempts: int = 3,
+                 retry_backoff: float = 0.5):
+        self.rag = rag
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.failed: List[PendingWrite] = []
+
+        self._queue: List[PendingWrite] = []
+        self._in_flight: List[PendingWrite] = []
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._committed = 0  # batches commit in ticket order
+        self._last_ticket: Dict[str, int] = {}
+        self._waiters = 0
+        self._retry: List[PendingWrite] = []
+        self._retry_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, context: Dict, session: str = "default", memory=None) -> int:
+        """Queue `context` for the vector DB (and a save of `memory`); returns its ticket."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue is closed")
+            self._next_ticket += 1
+            self._queue.append(PendingWrite(self._next_ticket, session, context, memory, time.time()))
+            self._last_ticket[session] = self._next_ticket
+            self._cond.notify_all()
+            return self._next_ticket
+
+    def pending(self, session: str = "default") -> List[Dict]:
+        with self._cond:
+            writes = self.failed + self._retry + self._in_flight + self._queue
+            return [w.context for w in writes if w.session == session]
+
+    def wait(self, session: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything `session` (or anyone, for None) submitted so far is
+        settled. True only if all of it was committed; False on timeout or failure.
+        """
+        with self._cond:
+            target = self._next_ticket if session is None else self._last_ticket.get(session, 0)
+            # Waiters make the worker commit now instead of sitting out max_delay
+            self._waiters += 1
+            self._cond.notify_all()
+            try:
+                if not self._cond.wait_for(lambda: self._committed >= target, timeout):
+                    return False
+                return not any(w.ticket <= target and session in (None, w.session) for w in self.failed)
+            finally:
+                self._waiters -= 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return self.wait(None, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self.failed:
+            logger.error(f"WriteBehindQueue: Stopped with {len(self.failed)} writes that never reached the vector DB")
+        else:
+            logger.info("WriteBehindQueue: Flushed and stopped")
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._retry or self._queue or self._closed)
+                if self._retry:
+                    # A failed batch goes again on its own, ahead of newer writes
+                    while time.time() < self._retry_at:
+                        self._cond.wait(self._retry_at - time.time())
+                    batch, self._retry = self._retry, []
+                elif not self._queue:
+                    return
+                else:
+                    deadline = self._queue[0].queued + self.max_delay
+                    while len(self._queue) < self.max_batch and not (self._closed or self._waiters):
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    batch = self._queue[:self.max_batch]
+                    del self._queue[:self.max_batch]
+                self._in_flight = batch
+
+            ok = self._commit(batch)
+
+            with self._cond:
+                self._in_flight = []
+                for write in batch:
+                    write.attempts += 1
+                if ok:
+                    self._committed = batch[-1].ticket
+                elif batch[0].attempts < self.max_attempts:
+                    self._retry = batch
+                    self._retry_at = time.time() + self.retry_backoff * 2 ** (batch[0].attempts - 1)
+                else:
+                    logger.error(f"Write-behind gave up on {len(batch)} writes after {batch[0].attempts} attempts")
+                    self.failed += batch
+                    self._committed = batch[-1].ticket
+                self._cond.notify_all()
+
+    def _commit(self, batch: List[PendingWrite]) -> bool:
+        """Write one batch; False when the vector DB write failed and the batch should be retried."""
+        # The same preference stated twice in quick succession is embedded once
+        contexts = {}
+        for write in batch:
+            contexts.setdefault(json.dumps(write.context, sort_keys=True, default=str), write.context)
+
+        try:
+            self.rag.add_many_to_vector_db(list(contexts.values()))
+            ok = True
+        except Exception:
+            logger.exception(f"Write-behind batch of {len(contexts)} contexts failed")
+            ok = False
+
+        memories = {id(w.memory): w.memory for w in batch if w.memory is not None}
+        for memory in memories.values():
+            try:
+                memory.save()
+            except Exception:
+                logger.exception("Write-behind memory save failed")
+
+        attrs = {"status": "ok" if ok else "failed"}
+        write_behind_batch_size.record(len(contexts), attrs)
+        if not ok:
+            return False
+        now = time.time()
+        for write in batch:
+            write_behind_lag.record((now - write.queued) * 1000)
+        logger.info(f"💾 Write-behind committed {len(contexts)} writes ({len(batch)} queued)")
+        return True
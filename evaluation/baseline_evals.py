@@ -134,4 +134,7 @@ async def run_eval() -> Dict[str, Any]:
 # Entry point (ONLY place asyncio.run is allowed)
 # -------------------------
 if __name__ == "__main__":
+    from otel_setup import setup_tracing
+
+    setup_tracing()
     asyncio.run(run_eval())
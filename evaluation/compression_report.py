@@ -0,0 +1,115 @@
+import json
+import math
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+
+from core.RAGSystem import RAGSystem
+from core.vector_store import FaissVectorStore
+from evaluation.test_cases import TEST_CASES
+
+
+# (compression, rescore factor) pairs compared against an exact float32 index
+CONFIGS = [
+    ("none", 0),
+    ("float16", 0),
+    ("int8", 0),
+    ("int8", 4),
+    ("pq", 0),
+    ("pq", 4),
+]
+TOP_K = 5
+
+
+# -------------------------
+# Corpus + queries
+# -------------------------
+def load_knowledge_embeddings(rag: RAGSystem):
+    page = rag.knowledge_collection.get(include=["documents", "embeddings"])
+    return page["ids"], page["documents"], np.asarray(page["embeddings"], dtype=np.float32)
+
+
+def build_queries(rag: RAGSystem, documents: List[str], max_chunk_queries: int = 200) -> np.ndarray:
+    """Test-case prompts plus the opening line of each chunk, as a stand-in for real traffic."""
+    prompts = [case["prompt"] for case in TEST_CASES]
+    openings = [doc.strip().split("\n")[0][:120] for doc in documents[:max_chunk_queries]]
+    return rag.model.encode(prompts + [o for o in openings if o], batch_size=rag.embed_batch_size)
+
+
+def recall_at_k(results: List[List[str]], truth: List[List[str]], k: int) -> float:
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / max(len(t[:k]), 1) for r, t in zip(results, truth)]))
+
+
+# -------------------------
+# Report
+# -------------------------
+def run_report(index_type: str = "flat", top_k: int = TOP_K, pq_m: int = 16) -> Dict[str, Any]:
+    rag = RAGSystem()
+    ids, documents, embeddings = load_knowledge_embeddings(rag)
+    n = len(ids)
+    if n < 2:
+        raise RuntimeError("Knowledge base is too small to compare compression settings.")
+
+    queries = build_queries(rag, documents)
+    metadatas = [{} for _ in ids]
+    # Small corpora can't fill 256 PQ codewords or many IVF lists; shrink them so every row trains
+    pq_nbits = min(8, int(math.log2(n)))
+    nlist = max(1, min(256, n // 39))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        reference = FaissVectorStore(tmp, "reference", index_type="flat")
+        reference.add(ids, documents, embeddings, metadatas)
+        truth = reference.query(queries, n_results=top_k)["ids"]
+        reference_bytes = reference.index_nbytes()
+
+        for compression, rescore in CONFIGS:
+            store = FaissVectorStore(
+                tmp,
+                f"{index_type}_{compression}_{rescore}",
+                index_type=index_type,
+                nlist=nlist,
+                compression=compression,
+                pq_m=pq_m,
+                pq_nbits=pq_nbits,
+                rescore=rescore,
+                train_size=n,
+            )
+            store.add(ids, documents, embeddings, metadatas)
+            results = store.query(queries, n_results=top_k)["ids"]
+            index_bytes = store.index_nbytes()
+
+            rows.append({
+                "compression": compression,
+                "rescore": rescore,
+                "bytes_per_vector": index_bytes / n,
+                "memory_saved": 1 - index_bytes / reference_bytes,
+                f"recall@{top_k}": recall_at_k(results, truth, top_k),
+            })
+
+    summary = {
+        "index_type": index_type,
+        "chunks": n,
+        "queries": len(queries),
+        "dimension": int(embeddings.shape[1]),
+        "pq": {"m": pq_m, "nbits": pq_nbits},
+        "float32_bytes_per_vector": reference_bytes / n,
+    }
+
+    print(f"\n📦 Compression report ({index_type}, {n} chunks, {len(queries)} queries)")
+    print(f"{'compression':<12}{'rescore':>8}{'bytes/vec':>12}{'saved':>9}{f'recall@{top_k}':>11}")
+    for row in rows:
+        print(
+            f"{row['compression']:<12}{row['rescore']:>8}{row['bytes_per_vector']:>12.1f}"
+            f"{row['memory_saved']:>9.1%}{row[f'recall@{top_k}']:>11.3f}"
+        )
+
+    with open("compression_report.json", "w") as f:
+        json.dump({"summary": summary, "results": rows}, f, indent=2)
+
+    return {"summary": summary, "results": rows}
+
+
+if __name__ == "__main__":
+    run_report()
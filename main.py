@@ -1,18 +1,59 @@
+import asyncio
+import argparse
+
 from core.orchestrator import Orchestrator
 
 from opentelemetry import trace
 from otel_setup import setup_tracing
 
 def main():
+    parser = argparse.ArgumentParser(description="Second Brain CLI")
+    parser.add_argument("--lazy", action="store_true", help="defer model loads until first use")
+    parser.add_argument("--warm-up", action="store_true", help="with --lazy, load models in the background")
+    parser.add_argument("--intent-router", action="store_true", help="route confident turns locally, LLM controller as fallback")
+    parser.add_argument("--router-shadow-rate", type=float, default=0.05,
+                        help="fraction of locally routed turns also checked against the LLM controller")
+    parser.add_argument("--planner", action="store_true", help="one fused LLM call for routing and preference extraction")
+    parser.add_argument("--response-cache", action="store_true", help="reuse answers to near-identical questions")
+    parser.add_argument("--speculative", action="store_true", help="retrieve knowledge while the controller decides")
+    parser.add_argument("--ingest-workers", type=int, default=0,
+                        help="ingest seed notes with this many parallel split/embed workers (0: one at a time)")
+    parser.add_argument("--serve", action="store_true", help="serve many sessions over HTTP instead of the CLI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--socket", help="also serve on this unix socket path")
+    parser.add_argument("--max-concurrent", type=int, default=32, help="turns processed at once across sessions")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
     print("Hello from your second-brain! The bot is ready to chat. Please reply with /exit to quit")
     setup_tracing()
     tracer = trace.get_tracer(__name__)
 
     with tracer.start_as_current_span("orchestrator.run"):
-        app = Orchestrator()
-        app.run()
+        app = Orchestrator(lazy=args.lazy, warm_up=args.warm_up, speculative_retrieval=args.speculative,
+                           intent_router=args.intent_router, router_shadow_rate=args.router_shadow_rate,
+                           planner=args.planner, response_cache=args.response_cache,
+                           ingest_workers=args.ingest_workers)
+        asyncio.run(app.run())
 
 
+def serve(args):
+    from core.server import SessionServer
+
+    setup_tracing()
+    server = SessionServer(max_concurrent=args.max_concurrent, lazy=args.lazy, warm_up=args.warm_up,
+                           speculative_retrieval=args.speculative, intent_router=args.intent_router,
+                           router_shadow_rate=args.router_shadow_rate, planner=args.planner,
+                           response_cache=args.response_cache, ingest_workers=args.ingest_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, unix_socket=args.socket))
+    except KeyboardInterrupt:
+        pass
+
 
 if __name__ == "__main__":
     main()
@@ -1,29 +1,57 @@
 # observability.py
+import os
+import threading
+
 from opentelemetry import trace, metrics
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.trace.export import SimpleSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 
-resource = Resource.create({
-    "service.name": "second-brain",
-    "service.version": "0.1.0"
-})
+# Opt-in: put the (pattern-redacted) user input on controller/planner spans as
+# `input.text`, for retraining the intent router from exported traces.
+RECORD_INPUT_TEXT = os.getenv("SECOND_BRAIN_RECORD_INPUT_TEXT", "").lower() in ("1", "true", "yes")
 
-trace.set_tracer_provider(
-    TracerProvider(resource=resource)
-)
-metrics.set_meter_provider(
-    MeterProvider(resource=resource)
-)
+# Instruments below are created against the global proxy tracer/meter, which is
+# cheap and starts forwarding once setup_tracing() installs the SDK providers.
+# The SDK and gRPC exporters are only imported and built at that point.
+_setup_lock = threading.Lock()
+_configured = False
 
-trace.get_tracer_provider().add_span_processor(
-    SimpleSpanProcessor(
-        OTLPSpanExporter(endpoint="http://localhost:4317", insecure=True)
-    )
-)
+
+def setup_tracing(endpoint: str = "http://localhost:4317"):
+    """Install the SDK tracer/meter providers with OTLP gRPC exporters (idempotent)."""
+    global _configured
+    with _setup_lock:
+        if _configured:
+            return
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+
+        resource = Resource.create({
+            "service.name": "second-brain",
+            "service.version": "0.1.0"
+        })
+
+        trace.set_tracer_provider(
+            TracerProvider(resource=resource)
+        )
+        metrics.set_meter_provider(
+            MeterProvider(
+                resource=resource,
+                metric_readers=[
+                    PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=endpoint, insecure=True))
+                ],
+            )
+        )
+
+        trace.get_tracer_provider().add_span_processor(
+            SimpleSpanProcessor(
+                OTLPSpanExporter(endpoint=endpoint, insecure=True)
+            )
+        )
+        _configured = True
 
 
 
@@ -56,3 +84,158 @@ memory_writes = meter.create_counter(
     name="memory.writes",
     description="Memory writes attempted"
 )
+
+ingest_documents = meter.create_counter(
+    name="ingest.documents",
+    description="Note files chunked into the knowledge base"
+)
+
+ingest_chunks = meter.create_counter(
+    name="ingest.chunks",
+    description="Knowledge chunks embedded and written"
+)
+
+ingest_throughput = meter.create_histogram(
+    name="ingest.throughput",
+    unit="1/s",
+    description="Ingestion throughput per batch (docs/s and chunks/s, see 'unit' attribute)"
+)
+
+cache_hits = meter.create_counter(
+    name="cache.hits",
+    description="Cache lookups served from cache (tagged by cache name)"
+)
+
+cache_misses = meter.create_counter(
+    name="cache.misses",
+    description="Cache lookups that missed (tagged by cache name)"
+)
+
+cache_memory = meter.create_up_down_counter(
+    name="cache.memory.bytes",
+    unit="By",
+    description="Approximate memory held by cached values (tagged by cache name)"
+)
+
+guardrail_latency = meter.create_histogram(
+    name="guardrail.latency.ms",
+    unit="ms",
+    description="PII scan latency (tagged by path: prefilter, cache or analyzer)"
+)
+
+speculative_retrievals = meter.create_counter(
+    name="speculation.retrievals",
+    description="Speculative retrievals started before the controller decided (tagged by outcome: used or wasted)"
+)
+
+speculation_time_saved = meter.create_counter(
+    name="speculation.time_saved.ms",
+    unit="ms",
+    description="Retrieval time hidden behind the controller call by speculative retrieval"
+)
+
+router_decisions = meter.create_counter(
+    name="router.decisions",
+    description="Intent router decisions (tagged by path: local or fallback to the LLM controller)"
+)
+
+router_agreement = meter.create_counter(
+    name="router.agreement",
+    description="Router-vs-LLM comparisons on fallbacks and shadow checks (tagged agree=true|false)"
+)
+
+response_cache_saved_latency = meter.create_histogram(
+    name="response_cache.saved_latency.ms",
+    unit="ms",
+    description="Synthesizer latency avoided by semantic response cache hits (original generation time)"
+)
+
+synthesis_ttft = meter.create_histogram(
+    name="synthesis.ttft.ms",
+    unit="ms",
+    description="Time from the synthesizer prompt to its first streamed token"
+)
+
+response_ttft = meter.create_histogram(
+    name="response.ttft.ms",
+    unit="ms",
+    description="Time from user input to the first answer text shown (streamed turns)"
+)
+
+response_latency = meter.create_histogram(
+    name="response.latency.ms",
+    unit="ms",
+    description="Time from user input to the complete answer"
+)
+
+stream_redaction_latency = meter.create_histogram(
+    name="guardrail.stream.scan.ms",
+    unit="ms",
+    description="PII scan time per streamed output window"
+)
+
+stream_redaction_hold = meter.create_histogram(
+    name="guardrail.stream.hold.ms",
+    unit="ms",
+    description="Time streamed output waits in the redaction buffer before being emitted"
+)
+
+context_tokens = meter.create_histogram(
+    name="context.tokens",
+    unit="{token}",
+    description="Estimated synthesizer context tokens per turn (tagged by stage: raw or packed)"
+)
+
+write_behind_batch_size = meter.create_histogram(
+    name="write_behind.batch.size",
+    unit="{item}",
+    description="Preference/context writes committed per write-behind batch (after coalescing)"
+)
+
+write_behind_lag = meter.create_histogram(
+    name="write_behind.lag.ms",
+    unit="ms",
+    description="Time from a write being queued to it being committed to the vector store and disk"
+)
+
+executor_queue_depth = meter.create_up_down_counter(
+    name="executor.queue.depth",
+    unit="{task}",
+    description="Blocking calls submitted to a worker pool that haven't started yet (tagged by pool)"
+)
+
+executor_wait = meter.create_histogram(
+    name="executor.wait.ms",
+    unit="ms",
+    description="Time a blocking call waited for a free worker thread (tagged by pool)"
+)
+
+embedding_batch_size = meter.create_histogram(
+    name="embedding.batch.size",
+    unit="{text}",
+    description="Texts encoded per micro-batched embedding forward pass"
+)
+
+embedding_queue_delay = meter.create_histogram(
+    name="embedding.queue.delay.ms",
+    unit="ms",
+    description="Time an encode request waited for its micro-batch to start"
+)
+
+server_sessions = meter.create_up_down_counter(
+    name="server.sessions",
+    unit="{session}",
+    description="Conversation sessions currently open in the server"
+)
+
+server_turns = meter.create_counter(
+    name="server.turns",
+    unit="1",
+    description="Turns handled by the server (tagged by status)"
+)
+
+server_turn_wait = meter.create_histogram(
+    name="server.turn.wait.ms",
+    unit="ms",
+    description="Time a turn waited for a free concurrency slot"
+)